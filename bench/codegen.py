@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from codegen import CodeGenerator
+from ctx import Context
+from lexer import Lexer
+from parser import Parser
+
+INCLUDE_PATH = os.path.join(os.path.dirname(__file__), "..", "stdlib")
+
+
+class ConcatGenerator(CodeGenerator):
+    # the previous string-concatenating emitter, kept for comparison
+    def __init__(self, ctx):
+        super().__init__(ctx)
+        self.out = ""
+
+    def compile(self, statements):
+        super().compile(statements)
+        return self.out
+
+    def emit(self, code):
+        self.out += code
+
+
+def generated_source(count):
+    chunk = """func f{0}(a, b) {{
+    let s = fmt::to_string(a)
+    if a + b * 2 >= 10 {{
+        return string::repeat(s, b - a % 3)
+    }}
+    return f{0}(a - 1, b)
+}}
+"""
+    return "".join(chunk.format(i) for i in range(count)) + "func main() {}\n"
+
+
+def measure(generator_cls, ctx, statements):
+    start = time.perf_counter()
+    out = generator_cls(ctx).compile(statements)
+    return out, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Code generation benchmark")
+    parser.add_argument("-n", dest="count", type=int, default=1000,
+                        help="Number of functions in the smallest program (default: 1000)")
+    parser.add_argument("-s", dest="steps", type=int, default=4,
+                        help="Number of doublings of the program size (default: 4)")
+    args = parser.parse_args()
+
+    print(f"{'functions':>10} {'output':>10} {'concat':>10} {'chunked':>10} {'chunked/KB':>12}")
+    for step in range(args.steps):
+        count = args.count << step
+        ctx = Context("<bench>", generated_source(count), INCLUDE_PATH)
+        statements = Parser(ctx, Lexer(ctx).scan_tokens()).parse()
+
+        old_out, old_time = measure(ConcatGenerator, ctx, statements)
+        new_out, new_time = measure(CodeGenerator, ctx, statements)
+        assert old_out == new_out, "outputs differ"
+
+        kb = len(new_out) / 1e3
+        print(f"{count:>10} {kb:>8.0f}KB {old_time:>9.3f}s {new_time:>9.3f}s "
+              f"{new_time / kb * 1e6:>10.1f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from codegen import CodeGenerator
+from ctx import Context
+from lexer import Lexer
+from main import build
+from optimizer import Optimizer
+from parser import Parser
+
+INCLUDE_PATH = os.path.join(os.path.dirname(__file__), "..", "stdlib")
+
+LINE = 100
+
+CONCAT = """func main() {{
+    let line = string::repeat("x", {width})
+    let out = ""
+    for i in num::range({lines}) {{
+        out = out + line + "\\n"
+    }}
+    fmt::print(string::len(out))
+}}
+"""
+
+BUILDER = """func main() {{
+    let line = string::repeat("x", {width})
+    let b = string::builder()
+    string::reserve(b, {size})
+    for i in num::range({lines}) {{
+        string::append(b, line)
+        string::append(b, "\\n")
+    }}
+    fmt::print(string::len(string::finish(b)))
+}}
+"""
+
+
+class CopyingGenerator(CodeGenerator):
+    # emits `x = x + ...` as written, copying x on every assignment
+    def append_operands(self, expr):
+        return None
+
+
+def run(generator_cls, template, size, tmp):
+    src = template.format(width=LINE - 1, lines=size // LINE, size=size)
+    ctx = Context("<bench>", src, INCLUDE_PATH)
+    statements = Optimizer().optimize(Parser(ctx, Lexer(ctx).scan_tokens()).parse())
+    code = generator_cls(ctx).compile(statements)
+
+    exe = os.path.join(tmp, "bench")
+    if not build(INCLUDE_PATH, exe, code, flags=["-O2"]):
+        sys.exit("build failed")
+
+    start = time.perf_counter()
+    proc = subprocess.run([exe], capture_output=True, text=True, check=True)
+    elapsed = time.perf_counter() - start
+    assert int(proc.stdout) == size // LINE * LINE, proc.stdout
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="String concatenation benchmark")
+    parser.add_argument("-s", dest="size", type=int, default=100,
+                        help="Size of the largest report in MB (default: 100)")
+    parser.add_argument("--copy-limit", type=int, default=4,
+                        help="Largest report built by copying, which is quadratic (default: 4)")
+    args = parser.parse_args()
+
+    sizes = [4 ** i for i in range(args.size.bit_length()) if 4 ** i < args.size] + [args.size]
+
+    print(f"{'report':>8} {'copy':>10} {'append':>10} {'builder':>10}")
+    with tempfile.TemporaryDirectory(prefix="aiur-bench-") as tmp:
+        for mb in sizes:
+            size = mb * 1000 * 1000
+            copy = f"{run(CopyingGenerator, CONCAT, size, tmp):.3f}s" if mb <= args.copy_limit else "-"
+            append = run(CodeGenerator, CONCAT, size, tmp)
+            builder = run(CodeGenerator, BUILDER, size, tmp)
+            print(f"{mb:>6}MB {copy:>10} {append:>9.3f}s {builder:>9.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from ctx import Context
+from main import build, compile
+
+INCLUDE_PATH = os.path.join(os.path.dirname(__file__), "..", "stdlib")
+
+PROGRAMS = {
+    "fizzbuzz": """func main() {{
+    for i in num::range({lines}) {{
+        if i % 15 == 0 {{
+            fmt::print("FizzBuzz")
+        }} else if i % 5 == 0 {{
+            fmt::print("Fizz")
+        }} else if i % 3 == 0 {{
+            fmt::print("Buzz")
+        }} else {{
+            fmt::print(i)
+        }}
+    }}
+}}
+""",
+    "floats": """func main() {{
+    for i in num::range({lines}) {{
+        fmt::print(num::sqrt(i))
+    }}
+}}
+""",
+}
+
+# fmt.h before output was buffered, every write streams a stringstream to
+# std::cout
+STREAM_FMT = """#pragma once
+#include <iostream>
+#include <sstream>
+#include <vector>
+
+#include "_string.h"
+
+namespace fmt {
+// export fmt::to_string
+template <typename T> std::string to_string(const T &t) {
+  std::stringstream s;
+  s << t;
+  return s.str();
+}
+
+// export fmt::write
+template <typename T> void write(const T &t) { std::cout << fmt::to_string(t); }
+
+// export fmt::print
+template <typename T> void print(const T &t) {
+  fmt::write(t);
+  fmt::write("\\n");
+}
+}
+"""
+
+
+def stream_stdlib(tmp):
+    path = os.path.join(tmp, "stdlib")
+    shutil.copytree(INCLUDE_PATH, path)
+    with open(os.path.join(path, "fmt.h"), "w") as f:
+        f.write(STREAM_FMT)
+    return path
+
+
+def run(include_path, template, lines, tmp):
+    ctx = Context("<bench>", template.format(lines=lines), include_path)
+    code = compile(ctx)
+
+    exe = os.path.join(tmp, "bench")
+    if not build(include_path, exe, code, flags=["-O2"], use_pch=False):
+        sys.exit("build failed")
+
+    start = time.perf_counter()
+    proc = subprocess.run([exe], stdout=subprocess.PIPE, check=True)
+    elapsed = time.perf_counter() - start
+    return hashlib.sha256(proc.stdout).hexdigest(), len(proc.stdout), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="fmt::print throughput benchmark")
+    parser.add_argument("-n", dest="lines", type=int, default=10_000_000,
+                        help="Lines printed per program (default: 10000000)")
+    args = parser.parse_args()
+
+    print(f"{'':>10} {'stream':>16} {'buffered':>16}")
+    with tempfile.TemporaryDirectory(prefix="aiur-bench-") as tmp:
+        stream_path = stream_stdlib(tmp)
+        for name, template in PROGRAMS.items():
+            digest, size, stream = run(stream_path, template, args.lines, tmp)
+            buffered_digest, _, buffered = run(INCLUDE_PATH, template, args.lines, tmp)
+            assert digest == buffered_digest, f"{name}: output differs"
+            mb = size / 1000 / 1000
+            print(f"{name:>10} {stream:>7.3f}s {mb/stream:>5.0f}MB/s "
+                  f"{buffered:>7.3f}s {mb/buffered:>5.0f}MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from ctx import Context
+from main import build, compile
+
+INCLUDE_PATH = os.path.join(os.path.dirname(__file__), "..", "stdlib")
+
+# every kind of response the client has to read, each followed by the
+# length of its body
+CHECK = """func main() {{
+    fmt::write(net::http_get("http://127.0.0.1:{port}/length/5"))
+    fmt::print(string::len(net::http_get("http://127.0.0.1:{port}/length/1000000")))
+    fmt::write(net::http_get("{url}/chunked/5"))
+    fmt::print(string::len(net::http_get("{url}/chunked/1000000")))
+    fmt::print(string::len(net::http_get("{url}/close/1000")))
+    fmt::print(string::len(net::http_get("{url}/eof/1000")))
+    fmt::print(string::len(net::http_get("{url}/empty")))
+    for body in net::http_get_many(string::split("{url}/length/1 {url}/close/2 {url}/chunked/3 {url}/eof/4 {url}/length/5", " ")) {{
+        fmt::print(string::len(body))
+    }}
+}}
+"""
+
+EXPECTED = b"\x00\x01\x02\x03\x041000000\n\x00\x01\x02\x03\x041000000\n1000\n1000\n0\n1\n2\n3\n4\n5\n"
+
+# a new connection is only opened after the server closed one, on /close
+# and /eof
+EXPECTED_CONNECTIONS = 5
+
+SEQUENTIAL = """func main() {{
+    let n = 0
+    for i in num::range({requests}) {{
+        n = n + string::len(net::http_get("{url}/{path}/100"))
+    }}
+    fmt::print(n)
+}}
+"""
+
+BATCHED = """func main() {{
+    let urls = string::split(string::repeat("{url}/{path}/100 ", {requests}), " ")
+    let n = 0
+    for body in net::http_get_many(urls) {{
+        n = n + string::len(body)
+    }}
+    fmt::print(n)
+}}
+"""
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        with lock:
+            Handler.connections += 1
+
+    def do_GET(self):
+        kind, _, size = self.path[1:].partition("/")
+        # bytes that a NUL terminated string would cut short
+        body = bytes(i % 256 for i in range(int(size or 0)))
+
+        self.send_response(200)
+        if kind == "chunked":
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i in range(0, len(body), 4096):
+                chunk = body[i:i+4096]
+                self.wfile.write(b"%x;ext=1\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.write(b"0\r\nX-Trailer: 1\r\n\r\n")
+            return
+
+        if kind == "eof":
+            self.close_connection = True
+        else:
+            self.send_header("Content-Length", str(len(body)))
+        if kind == "close":
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+lock = threading.Lock()
+
+
+def run(src, tmp):
+    ctx = Context("<bench>", src, INCLUDE_PATH)
+    exe = os.path.join(tmp, "bench")
+    if not build(INCLUDE_PATH, exe, compile(ctx), flags=["-O2"]):
+        sys.exit("build failed")
+
+    Handler.connections = 0
+    start = time.perf_counter()
+    proc = subprocess.run([exe], stdout=subprocess.PIPE, check=True)
+    return proc.stdout, time.perf_counter() - start, Handler.connections
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP client benchmark against a local http.server")
+    parser.add_argument("-n", dest="requests", type=int, default=10000,
+                        help="Requests per run (default: 10000)")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+
+    with tempfile.TemporaryDirectory(prefix="aiur-bench-") as tmp:
+        out, _, connections = run(CHECK.format(url=url, port=server.server_port), tmp)
+        assert out == EXPECTED, out
+        assert connections == EXPECTED_CONNECTIONS, connections
+        print("responses ok")
+
+        print(f"{'':>12} {'time':>10} {'req/s':>8} {'connections':>12}")
+        for name, template, path in [("close", SEQUENTIAL, "close"),
+                                     ("keep-alive", SEQUENTIAL, "length"),
+                                     ("pipelined", BATCHED, "length")]:
+            src = template.format(url=url, path=path, requests=args.requests)
+            out, elapsed, connections = run(src, tmp)
+            assert int(out) == args.requests * 100, out
+            print(f"{name:>12} {elapsed:>9.3f}s {args.requests/elapsed:>8.0f} {connections:>12}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from benchmark import many_functions
+from ctx import Context
+from expr import ImportStmt
+from lexer import Lexer
+from main import build, compile
+from parser import Parser
+
+INCLUDE_PATH = os.path.join(os.path.dirname(__file__), "..", "stdlib")
+EXAMPLES_PATH = os.path.join(os.path.dirname(__file__), "..", "examples")
+
+# every function is called with an int, a long and a size_t, which are
+# three template instantiations but one inferred int64 function
+CALLS = """func f{i}(a, b) {{
+    return a * b + {i}
+}}
+"""
+
+
+def mixed_calls(count):
+    funcs = [CALLS.format(i=i) for i in range(count)]
+    body = "".join(f"    fmt::print(f{i}({i}, 2), f{i}(big, 2), f{i}(string::len(s), 2))\n"
+                   for i in range(count))
+    return "".join(funcs) + "func main() {\n    let big = 600851475143\n    let s = \"abc\"\n" + body + "}\n"
+
+
+def programs(count):
+    out = {}
+    for file in sorted(os.listdir(EXAMPLES_PATH)):
+        if file.endswith(".aiur"):
+            with open(os.path.join(EXAMPLES_PATH, file)) as f:
+                src = f.read()
+            # g++ is timed on one translation unit, a program with imports
+            # is compiled per module
+            ctx = Context(file, src, INCLUDE_PATH)
+            if any(isinstance(stmt, ImportStmt) for stmt in Parser(ctx, Lexer(ctx).scan_tokens()).parse()):
+                continue
+            out[file] = src
+    out["many_functions"] = many_functions(count)
+    out["calls"] = mixed_calls(count)
+    return out
+
+
+def run(name, src, infer, flags, tmp):
+    ctx = Context(name, src, INCLUDE_PATH)
+    code = compile(ctx, infer=infer)
+    exe = os.path.join(tmp, "bench")
+
+    start = time.perf_counter()
+    if not build(INCLUDE_PATH, exe, code, flags=flags, use_cache=False):
+        sys.exit(f"{name}: build failed")
+    return time.perf_counter() - start, os.path.getsize(exe)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares g++ time and executable size with and without type inference")
+    parser.add_argument("-n", dest="count", type=int, default=500,
+                        help="Functions in the generated programs (default: 500)")
+    parser.add_argument("-O", dest="opt_level", choices=["0", "1", "2", "3"],
+                        help="Optimization level passed to g++ (default: none, like aiur compile)")
+    args = parser.parse_args()
+    flags = [f"-O{args.opt_level}"] if args.opt_level is not None else []
+
+    print(f"{'':>16} {'templates':>20} {'inferred':>20}")
+    with tempfile.TemporaryDirectory(prefix="aiur-bench-") as tmp:
+        for name, src in programs(args.count).items():
+            # the first build of a program may build a precompiled header
+            run(name, src, True, flags, tmp)
+            template_time, template_size = run(name, src, False, flags, tmp)
+            infer_time, infer_size = run(name, src, True, flags, tmp)
+            print(f"{name:>16} {template_time:>8.2f}s {template_size/1000:>8.1f}KB "
+                  f"{infer_time:>8.2f}s {infer_size/1000:>8.1f}KB")
+
+
+if __name__ == "__main__":
+    main()
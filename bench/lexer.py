@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from ctx import Context
+from lexer import CharLexer, Lexer
+
+
+def synthetic_source(size):
+    chunk = """// generated
+func f%d(a, b) {
+    let s = "%s"
+    if a + b * 2 >= 10 {
+        return fmt::to_string(a) + s
+    }
+    return string::repeat(s, b - a %% 3)
+}
+"""
+    parts = []
+    total = 0
+    i = 0
+    while total < size:
+        part = chunk % (i, "x" * (i % 200))
+        parts.append(part)
+        total += len(part)
+        i += 1
+    return "".join(parts)
+
+
+def measure(lexer_cls, ctx, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        tokens = lexer_cls(ctx).scan_tokens()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return tokens, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lexer micro-benchmark")
+    parser.add_argument("-s", dest="size", type=int, default=4_000_000,
+                        help="Size of the synthetic source in bytes (default: 4000000)")
+    parser.add_argument("-n", dest="repeat", type=int, default=3,
+                        help="Number of runs, best is reported (default: 3)")
+    args = parser.parse_args()
+
+    ctx = Context("<bench>", synthetic_source(args.size), "")
+
+    old_tokens, old_time = measure(CharLexer, ctx, args.repeat)
+    new_tokens, new_time = measure(Lexer, ctx, args.repeat)
+    assert old_tokens == new_tokens, "token streams differ"
+
+    mb = len(ctx.src) / 1e6
+    print(f"input: {mb:.1f} MB, {len(new_tokens)} tokens")
+    print(f"CharLexer: {old_time:.3f}s ({mb/old_time:.2f} MB/s)")
+    print(f"Lexer:     {new_time:.3f}s ({mb/new_time:.2f} MB/s)")
+    print(f"speedup:   {old_time/new_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
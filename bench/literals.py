@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from ctx import Context
+from main import build, compile
+
+INCLUDE_PATH = os.path.join(os.path.dirname(__file__), "..", "stdlib")
+
+PROGRAM = """func main() {{
+    let count = 0
+    for i in num::range({iterations}) {{
+        if string::contains("the quick brown fox jumps over the lazy dog", "lazy dog") {{
+            count = count + string::len("a literal longer than the small string buffer")
+        }}
+    }}
+    fmt::print(count)
+}}
+"""
+
+# linked into the benchmark program, reports the number of heap
+# allocations on stderr at exit
+ALLOCATION_COUNTER = """
+#include <cstdio>
+#include <cstdlib>
+#include <new>
+
+static size_t allocations = 0;
+
+void *operator new(size_t n) {
+  allocations++;
+  if (void *p = malloc(n))
+    return p;
+  throw std::bad_alloc();
+}
+void operator delete(void *p) noexcept { free(p); }
+void operator delete(void *p, size_t) noexcept { free(p); }
+
+static struct AllocationReport {
+  ~AllocationReport() { fprintf(stderr, "%zu\\n", allocations); }
+} allocation_report;
+"""
+
+
+def run(iterations, intern_strings, tmp):
+    ctx = Context("<bench>", PROGRAM.format(iterations=iterations), INCLUDE_PATH)
+    code = compile(ctx, intern_strings=intern_strings) + ALLOCATION_COUNTER
+
+    exe = os.path.join(tmp, "bench")
+    if not build(INCLUDE_PATH, exe, code, flags=["-O2"]):
+        sys.exit("build failed")
+
+    start = time.perf_counter()
+    proc = subprocess.run([exe], capture_output=True, text=True, check=True)
+    elapsed = time.perf_counter() - start
+    return int(proc.stderr), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="String literal interning benchmark")
+    parser.add_argument("-n", dest="iterations", type=int, default=10_000_000,
+                        help="Loop iterations evaluating the literals (default: 10000000)")
+    args = parser.parse_args()
+
+    print(f"{'':>12} {'allocations':>12} {'time':>10}")
+    with tempfile.TemporaryDirectory(prefix="aiur-bench-") as tmp:
+        for intern_strings in (False, True):
+            allocations, elapsed = run(args.iterations, intern_strings, tmp)
+            name = "interned" if intern_strings else "constructed"
+            print(f"{name:>12} {allocations:>12} {elapsed:>9.3f}s")
+
+
+if __name__ == "__main__":
+    main()
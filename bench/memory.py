@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from ctx import Context
+from lexer import Lexer
+from parser import Parser
+
+
+def synthetic_source(count):
+    chunk = """func f{0}(a, b) {{
+    let s = "value {0}"
+    if a + b * 2 >= 10 {{
+        return fmt::to_string(a) + s
+    }}
+    return string::repeat(s, b - a % 3)
+}}
+"""
+    return "".join(chunk.format(i) for i in range(count)) + "func main() {}\n"
+
+
+# tokens after a string with newlines, on the line it ends on and below
+MULTILINE = """func g() {
+    let s = "one
+two" + "three
+four" + fmt::to_string(1)
+    return s
+}
+"""
+
+
+def check_tokens(src):
+    # compact tokens have to read back as what the default lexer stores,
+    # error locations included
+    ctx = Context("<bench>", src, "")
+    default = Lexer(ctx).scan_tokens()
+    compact = Lexer(ctx, compact=True).scan_tokens()
+    assert len(default) == len(compact)
+    for a, b in zip(default, compact):
+        assert (a.typ, a.lexeme, a.literal, a.pos) == (b.typ, b.lexeme, b.literal, b.pos), (a, b)
+
+
+def measure(src, compact):
+    ctx = Context("<bench>", src, "")
+    tracemalloc.start()
+    start = time.perf_counter()
+    tokens = Lexer(ctx, compact).scan_tokens()
+    statements = Parser(ctx, tokens).parse()
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(tokens), len(statements), size, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Token and AST memory benchmark")
+    parser.add_argument("-n", dest="count", type=int, default=20000,
+                        help="Number of generated functions (default: 20000)")
+    args = parser.parse_args()
+
+    src = synthetic_source(args.count)
+    check_tokens(synthetic_source(100) + MULTILINE)
+    print(f"input: {len(src)/1e6:.1f} MB")
+    for compact in (False, True):
+        tokens, statements, size, elapsed = measure(src, compact)
+        print(f"{'compact' if compact else 'default':8} {tokens} tokens, "
+              f"{statements} statements, {size/1e6:.1f} MB retained, {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
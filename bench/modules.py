@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+AIUR = os.path.join(os.path.dirname(__file__), "..", "aiur")
+
+FUNCTION = """func {name}(n) {{
+    let out = ""
+    for i in num::range(n) {{
+        if i % {k} == 0 {{
+            out = out + "f{j}" + fmt::to_string(i * {k})
+        }} else {{
+            out = out + string::repeat("-", i % 5)
+        }}
+    }}
+    return string::len(out)
+}}
+"""
+
+
+def module_source(m, functions, prefix=""):
+    return "\n".join(FUNCTION.format(name=f"{prefix}f{j}", j=j, k=m + j + 2) for j in range(functions))
+
+
+def write_programs(tmp, modules, functions):
+    # the same functions once as a module per file and once in one file
+    split = os.path.join(tmp, "split")
+    os.makedirs(os.path.join(split, "lib"))
+    calls, single = [], []
+    for m in range(modules):
+        with open(os.path.join(split, "lib", f"m{m}.aiur"), "w") as f:
+            f.write(module_source(m, functions))
+        single.append(module_source(m, functions, f"m{m}_"))
+        calls += [(f"lib::m{m}::f{j}", f"m{m}_f{j}") for j in range(functions)]
+
+    imports = "".join(f"import lib::m{m}\n" for m in range(modules))
+    with open(os.path.join(split, "main.aiur"), "w") as f:
+        f.write(imports + "\nfunc main() {\n" + "".join(
+            f"    fmt::print({split_name}(20))\n" for split_name, _ in calls) + "}\n")
+    with open(os.path.join(tmp, "single.aiur"), "w") as f:
+        f.write("\n".join(single) + "\nfunc main() {\n" + "".join(
+            f"    fmt::print({name}(20))\n" for _, name in calls) + "}\n")
+    return os.path.join(split, "main.aiur"), os.path.join(tmp, "single.aiur")
+
+
+def build(path, out, env, *flags):
+    start = time.perf_counter()
+    subprocess.run([AIUR, "c", *flags, "-o", out, path], env=env, check=True)
+    return time.perf_counter() - start
+
+
+def edit(path, old, new):
+    with open(path) as f:
+        src = f.read()
+    with open(path, "w") as f:
+        f.write(src.replace(old, new, 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="separate compilation benchmark")
+    parser.add_argument("-m", dest="modules", type=int, default=32,
+                        help="Number of modules (default: 32)")
+    parser.add_argument("-f", dest="functions", type=int, default=8,
+                        help="Functions per module (default: 8)")
+    parser.add_argument("-j", dest="jobs", type=int, default=os.cpu_count(),
+                        help="g++ processes for the split program (default: number of CPUs)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="aiur-bench-") as tmp:
+        split, single = write_programs(tmp, args.modules, args.functions)
+        # a cache of its own, the precompiled headers are built up front
+        cache = os.path.join(tmp, "cache")
+        env = dict(os.environ, AIUR_CACHE_DIR=cache)
+        exe = os.path.join(tmp, "prog")
+        build(split, exe, env, "-j", str(args.jobs))
+        expected = subprocess.run([exe], capture_output=True, check=True).stdout
+        build(single, exe, env)
+        assert subprocess.run([exe], capture_output=True, check=True).stdout == expected
+        shutil.rmtree(os.path.join(cache, "objects"))
+
+        # a single file has to be compiled again after any edit
+        print(f"{args.modules} modules, {args.functions} functions each")
+        print(f"{'single file':>24} {build(single, exe, env, '--no-cache'):8.2f}s")
+        print(f"{'modules, cold':>24} {build(split, exe, env, '-j', str(args.jobs)):8.2f}s")
+        print(f"{'modules, unchanged':>24} {build(split, exe, env, '-j', str(args.jobs)):8.2f}s")
+        edit(os.path.join(os.path.dirname(split), "lib", "m0.aiur"), "\"-\"", "\"+\"")
+        print(f"{'modules, one edited':>24} {build(split, exe, env, '-j', str(args.jobs)):8.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from ctx import Context
+from main import build, compile
+
+INCLUDE_PATH = os.path.join(os.path.dirname(__file__), "..", "stdlib")
+
+# counts primes by trial division, iterations get slower as i grows so
+# evenly split ranges would be unbalanced
+PROGRAM = """func is_prime(n) {{
+    if n < 2
+        return false
+    for i in num::range(2, num::sqrt(n) + 1) {{
+        if n % i == 0
+            return false
+    }}
+    return true
+}}
+
+func main() {{
+    let count = 0
+    for {par} i in num::range({n}) {reduce} {{
+        if is_prime(i)
+            count = count + 1
+    }}
+    fmt::print(count)
+}}
+"""
+
+
+def build_program(n, parallel, tmp):
+    src = PROGRAM.format(n=n, par="par" if parallel else "",
+                         reduce="reduce sum count" if parallel else "")
+    exe = os.path.join(tmp, "par" if parallel else "serial")
+    if not build(INCLUDE_PATH, exe, compile(Context("<bench>", src, INCLUDE_PATH)), flags=["-O2"]):
+        sys.exit("build failed")
+    return exe
+
+
+def run(exe, threads=None):
+    env = dict(os.environ)
+    if threads is not None:
+        env["AIUR_THREADS"] = str(threads)
+    start = time.perf_counter()
+    proc = subprocess.run([exe], capture_output=True, text=True, check=True, env=env)
+    return int(proc.stdout), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="for par benchmark")
+    parser.add_argument("-n", type=int, default=5_000_000,
+                        help="Numbers to test for primality (default: 5000000)")
+    args = parser.parse_args()
+
+    threads = sorted({2 ** i for i in range(os.cpu_count().bit_length())} | {os.cpu_count()})
+
+    with tempfile.TemporaryDirectory(prefix="aiur-bench-") as tmp:
+        serial = build_program(args.n, False, tmp)
+        parallel = build_program(args.n, True, tmp)
+
+        expected, baseline = run(serial)
+        print(f"{'serial':>10} {baseline:>8.3f}s")
+        for n in threads:
+            count, elapsed = run(parallel, n)
+            assert count == expected, (count, expected)
+            print(f"{n:>7} thr {elapsed:>8.3f}s {baseline/elapsed:>6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
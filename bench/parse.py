@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import ctx
+from ctx import Context
+from expr import AssignExpr, BinaryExpr, CallExpr, GroupingExpr, UnaryExpr, VariableExpr
+from lexer import Lexer, TokenType
+from parser import Parser
+
+EXAMPLES_PATH = os.path.join(os.path.dirname(__file__), "..", "examples")
+
+
+class RecursiveParser(Parser):
+    # the previous recursive-descent expression grammar, kept for comparison
+    def expression(self):
+        return self.assignment()
+
+    def assignment(self):
+        expr = self.equality()
+
+        if self.match(TokenType.ASSIGN):
+            value = self.assignment()
+
+            if isinstance(expr, VariableExpr):
+                return AssignExpr(expr.name, value)
+            else:
+                ctx.error("invalid assignment target",
+                          self.ctx, self.peek().pos)
+
+        return expr
+
+    def binary(self, operand, types):
+        expr = operand()
+
+        while self.match_any(*types):
+            op = self.previous()
+            right = operand()
+            expr = BinaryExpr(expr, op, right)
+
+        return expr
+
+    def equality(self):
+        return self.binary(self.comparison, (TokenType.NEQ, TokenType.EQ))
+
+    def comparison(self):
+        return self.binary(self.term, (TokenType.GT, TokenType.GE, TokenType.LT, TokenType.LE))
+
+    def term(self):
+        return self.binary(self.factor, (TokenType.PLUS, TokenType.MINUS))
+
+    def factor(self):
+        return self.binary(self.unary, (TokenType.MOD, TokenType.STAR, TokenType.SLASH))
+
+    def unary(self):
+        if self.match_any(TokenType.BANG, TokenType.MINUS):
+            op = self.previous()
+            right = self.unary()
+            return UnaryExpr(op, right)
+
+        return self.call()
+
+    def call(self):
+        expr = self.primary()
+
+        while self.match(TokenType.LPAREN):
+            arguments = []
+            if not self.check(TokenType.RPAREN):
+                arguments.append(self.expression())
+                while self.match(TokenType.COMMA):
+                    arguments.append(self.expression())
+
+            if not self.match(TokenType.RPAREN):
+                ctx.error(f"expected ), got {self.peek().typ}",
+                          self.ctx, self.peek().pos)
+            expr = CallExpr(expr, self.previous(), arguments)
+
+        return expr
+
+    def primary(self):
+        if self.match_any(TokenType.TRUE, TokenType.FALSE, TokenType.NUMBER, TokenType.STRING):
+            return self.literal(self.previous())
+        elif self.match(TokenType.LPAREN):
+            expr = self.expression()
+
+            if self.consume().typ != TokenType.RPAREN:
+                ctx.error(
+                    f"expected ), got {self.peek().typ}", self.ctx, self.peek().pos)
+
+            return GroupingExpr(expr)
+        elif self.match(TokenType.IDENTIFIER):
+            return VariableExpr(self.previous())
+        else:
+            ctx.error(f"unexpected {self.peek().typ}",
+                      self.ctx, self.peek().pos)
+
+    def match_any(self, *types):
+        for typ in types:
+            if self.match(typ):
+                return True
+        return False
+
+
+def generated_source(count, depth):
+    chunk = """func f{0}(a, b) {{
+    let x = a + b * 2 - (a % 3) + f(a, b - 1) == !b
+    if x {{ return a }} else {{ while a < b {{ a = a + 1 }} }}
+    return {1}a{2} + {3}
+}}
+"""
+    chain = " + ".join(f"v{i}" for i in range(50))
+    return "".join(chunk.format(i, "(" * depth, ")" * depth, chain)
+                   for i in range(count)) + "func main() {}\n"
+
+
+def measure(parser_cls, ctx, tokens, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        statements = parser_cls(ctx, tokens).parse()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return statements, best
+
+
+def report(name, ctx, repeat):
+    tokens = Lexer(ctx).scan_tokens()
+    old_statements, old_time = measure(RecursiveParser, ctx, tokens, repeat)
+    new_statements, new_time = measure(Parser, ctx, tokens, repeat)
+    assert old_statements == new_statements, f"{name}: ASTs differ"
+
+    print(f"{name}: {len(tokens)} tokens")
+    print(f"  RecursiveParser: {old_time:.3f}s ({len(tokens)/old_time:,.0f} tokens/s)")
+    print(f"  Parser:          {new_time:.3f}s ({len(tokens)/new_time:,.0f} tokens/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parser throughput benchmark")
+    parser.add_argument("-n", dest="count", type=int, default=5000,
+                        help="Number of generated functions (default: 5000)")
+    parser.add_argument("-d", dest="depth", type=int, default=50,
+                        help="Grouping depth in generated functions (default: 50)")
+    parser.add_argument("-r", dest="repeat", type=int, default=3,
+                        help="Number of runs, best is reported (default: 3)")
+    args = parser.parse_args()
+
+    corpus = []
+    for file in sorted(os.listdir(EXAMPLES_PATH)):
+        if file.endswith(".aiur"):
+            with open(os.path.join(EXAMPLES_PATH, file)) as f:
+                corpus.append(f.read())
+    report("examples/", Context("<examples>", "\n".join(corpus), ""), args.repeat * 100)
+
+    src = generated_source(args.count, args.depth)
+    report("generated", Context("<generated>", src, ""), args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+AIUR = os.path.join(ROOT, "aiur")
+EXAMPLE = os.path.join(ROOT, "examples", "fizzbuzz.aiur")
+
+
+def compile_times(env, out, runs):
+    # the build cache answers, what's left is the fixed cost of a command
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([AIUR, "c", "-o", out, EXAMPLE], env=env, check=True)
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="aiur serve latency benchmark")
+    parser.add_argument("-n", dest="runs", type=int, default=20,
+                        help="Compiles per mode (default: 20)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="aiur-bench-") as tmp:
+        out = os.path.join(tmp, "prog")
+        env = {name: value for name, value in os.environ.items() if name != "AIUR_SERVER"}
+        subprocess.run([AIUR, "c", "-o", out, EXAMPLE], env=env, check=True)
+        cold = compile_times(env, out, args.runs)
+
+        socket = os.path.join(tmp, "server.sock")
+        server = subprocess.Popen([AIUR, "serve", "--socket", socket], env=env,
+                                  stderr=subprocess.PIPE)
+        try:
+            server.stderr.readline()
+            served = compile_times(dict(env, AIUR_SERVER=socket), out, args.runs)
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f"{'aiur c':>14} {cold*1000:8.1f}ms")
+    print(f"{'aiur serve':>14} {served*1000:8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from ctx import Context
+from main import build, compile
+
+INCLUDE_PATH = os.path.join(os.path.dirname(__file__), "..", "stdlib")
+
+# answers every request on a connection, pipelined ones included
+SERVER = """func main() {
+    let server = net::listen(0)
+    fmt::print(net::port(server))
+    fmt::flush()
+
+    while true {
+        let c = net::next(server)
+        let request = net::read_until(server, c, "\\r\\n\\r\\n")
+        while string::len(request) > 0 {
+            net::write(server, c, "HTTP/1.1 200 OK\\r\\nContent-Length: 2\\r\\n\\r\\nok")
+            request = net::read_until(server, c, "\\r\\n\\r\\n")
+        }
+        if net::closed(server, c)
+            net::disconnect(server, c)
+    }
+}
+"""
+
+REQUEST = b"GET / HTTP/1.1\r\nHost: localhost\r\n\r\n"
+RESPONSE = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok"
+
+
+async def load(port, connections, start, duration):
+    latencies = []
+    # connections are all opened before the clock starts
+    clients = []
+    for _ in range(connections):
+        clients.append(await asyncio.open_connection("127.0.0.1", port))
+    await asyncio.sleep(max(start - time.time(), 0))
+
+    async def drive(reader, writer):
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            writer.write(REQUEST)
+            response = await reader.readexactly(len(RESPONSE))
+            latencies.append(time.perf_counter() - start)
+            assert response == RESPONSE, response
+        writer.close()
+
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(drive(r, w) for r, w in clients))
+    return latencies
+
+
+def worker(options):
+    return asyncio.run(load(*options))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="net::listen load test")
+    parser.add_argument("-c", dest="connections", type=int, default=1000,
+                        help="Concurrent connections (default: 1000)")
+    parser.add_argument("-d", dest="duration", type=float, default=10,
+                        help="Seconds to run (default: 10)")
+    parser.add_argument("-w", dest="workers", type=int, default=min(os.cpu_count(), 8),
+                        help="Client processes the connections are spread over (default: number of CPUs, at most 8)")
+    args = parser.parse_args()
+
+    # both ends of every connection live on this machine
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, max(soft, args.connections * 2 + 64)), hard))
+
+    with tempfile.TemporaryDirectory(prefix="aiur-bench-") as tmp:
+        exe = os.path.join(tmp, "server")
+        ctx = Context("<bench>", SERVER, INCLUDE_PATH)
+        if not build(INCLUDE_PATH, exe, compile(ctx), flags=["-O2"]):
+            sys.exit("build failed")
+
+        server = subprocess.Popen([exe], stdout=subprocess.PIPE)
+        try:
+            port = int(server.stdout.readline())
+            # the workers start sending at the same time, once every
+            # connection had time to open
+            start = time.time() + 2
+            shares = [args.connections // args.workers + (i < args.connections % args.workers)
+                      for i in range(args.workers)]
+            with multiprocessing.Pool(args.workers) as pool:
+                results = pool.map(worker, [(port, n, start, args.duration) for n in shares])
+        finally:
+            server.kill()
+            server.wait()
+
+    latencies = sorted(latency for result in results for latency in result)
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    print(f"{args.connections} connections, {len(latencies)} requests in {args.duration:.2f}s")
+    print(f"{len(latencies)/args.duration:.0f} req/s, p50 {p50:.2f}ms, p99 {p99:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
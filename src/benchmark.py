@@ -0,0 +1,175 @@
+import json
+import os
+import tempfile
+import time
+
+import stdlib_index
+from codegen import CodeGenerator
+from ctx import Context
+from expr import ImportStmt, count_nodes
+from infer import infer_types
+from lexer import Lexer
+from parser import Parser
+
+RESULTS_VERSION = 1
+
+UNITS = {
+    "lex": "tokens/s",
+    "parse": "nodes/s",
+    "infer": "nodes/s",
+    "codegen": "bytes/s",
+    "g++": "bytes/s",
+}
+
+
+def deep_nesting(depth):
+    body = "".join("    " * i + f"if n > {i} {{\n" for i in range(1, depth + 1))
+    body += "    " * (depth + 1) + "n = " + "(" * depth + "n + 1" + ")" * depth + "\n"
+    body += "".join("    " * i + "}\n" for i in range(depth, 0, -1))
+    return f"func main() {{\n    let n = 0\n{body}    fmt::print(n)\n}}\n"
+
+
+def many_functions(count):
+    # f{i} calls f{i/2}, deep call chains would hit g++'s template depth
+    funcs = ["func f0(a, b) {\n    return a + b\n}\n"]
+    for i in range(1, count):
+        funcs.append(f"""func f{i}(a, b) {{
+    if a % 2 == 0 {{
+        return f{i//2}(a + 1, b) * 2
+    }}
+    return f{i//2}(a, b - 1) - a
+}}
+""")
+    funcs.append(f"func main() {{\n    fmt::print(f{count-1}(1, 2))\n}}\n")
+    return "".join(funcs)
+
+
+def huge_strings(count, size):
+    lines = [f"    let s{i} = \"{chr(ord('a') + i % 26) * size}\"\n    fmt::print(string::len(s{i}))\n"
+             for i in range(count)]
+    return "func main() {\n" + "".join(lines) + "}\n"
+
+
+def stress_programs():
+    return {
+        "stress/deep_nesting": deep_nesting(100),
+        "stress/many_functions": many_functions(2000),
+        "stress/huge_strings": huge_strings(4, 1_000_000),
+    }
+
+
+def percentile(times, p):
+    ordered = sorted(times)
+    return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+def run_once(ctx, gxx):
+    # imported here because main imports this module
+    import main
+
+    timings = {}
+
+    start = time.perf_counter()
+    tokens = Lexer(ctx).scan_tokens()
+    timings["lex"] = (time.perf_counter() - start, len(tokens))
+
+    start = time.perf_counter()
+    statements = Parser(ctx, tokens).parse()
+    timings["parse"] = (time.perf_counter() - start, count_nodes(statements))
+
+    start = time.perf_counter()
+    types = infer_types(statements, stdlib_index.load(ctx.include_path))
+    timings["infer"] = (time.perf_counter() - start, timings["parse"][1])
+
+    start = time.perf_counter()
+    code = CodeGenerator(ctx, types=types).compile(statements)
+    timings["codegen"] = (time.perf_counter() - start, len(code))
+
+    if gxx:
+        with tempfile.TemporaryDirectory(prefix="aiur-bench-") as tmp:
+            start = time.perf_counter()
+            if not main.build(ctx.include_path, os.path.join(tmp, "bench.exe"), code, use_cache=False):
+                raise RuntimeError(f"{ctx.file}: g++ failed")
+            timings["g++"] = (time.perf_counter() - start, len(code))
+
+    return timings
+
+
+def bench_program(ctx, repeat, gxx):
+    samples = {}
+    for _ in range(repeat):
+        for phase, (elapsed, amount) in run_once(ctx, gxx).items():
+            samples.setdefault(phase, ([], amount))[0].append(elapsed)
+
+    results = {}
+    for phase, (times, amount) in samples.items():
+        median = percentile(times, 50)
+        results[phase] = {
+            "times": times,
+            "median": median,
+            "p90": percentile(times, 90),
+            "max": max(times),
+            "amount": amount,
+            "throughput": amount / median if median > 0 else 0,
+            "unit": UNITS[phase],
+        }
+    return results
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for program, phases in results.items():
+        for phase, result in phases.items():
+            base = baseline.get(program, {}).get(phase)
+            if base is None or base["median"] == 0:
+                continue
+            ratio = result["median"] / base["median"]
+            if ratio > 1 + threshold:
+                regressions.append((program, phase, ratio))
+    return regressions
+
+
+def bench_compiler(args):
+    import main
+
+    include_path = main.stdlib_path()
+    programs = {}
+    examples_path = os.path.join(os.path.dirname(__file__), "..", "examples")
+    for file in sorted(os.listdir(examples_path)):
+        if file.endswith(".aiur"):
+            with open(os.path.join(examples_path, file)) as f:
+                programs["examples/" + file] = f.read()
+    programs.update(stress_programs())
+
+    results = {}
+    for name, src in programs.items():
+        if args.filter and args.filter not in name:
+            continue
+
+        ctx = Context(name, src, include_path)
+        # the phases are measured on one translation unit, a program with
+        # imports is compiled per module
+        if any(isinstance(stmt, ImportStmt) for stmt in Parser(ctx, Lexer(ctx).scan_tokens()).parse()):
+            continue
+        if args.gxx:
+            # warm up the precompiled header outside of the measurements
+            run_once(ctx, True)
+        results[name] = bench_program(ctx, args.repeat, args.gxx)
+
+        print(name)
+        for phase, result in results[name].items():
+            print(f"  {phase:8} median {result['median']*1000:9.2f}ms  p90 {result['p90']*1000:9.2f}ms  "
+                  f"max {result['max']*1000:9.2f}ms  {result['throughput']:14,.0f} {result['unit']}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"version": RESULTS_VERSION, "results": results}, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for program, phase, ratio in regressions:
+            print(f"regression: {program} {phase} is {ratio:.2f}x slower than the baseline")
+        if regressions:
+            exit(1)
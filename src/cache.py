@@ -0,0 +1,146 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+from functools import lru_cache
+
+CACHE_PATH = os.environ.get(
+    "AIUR_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "aiur"))
+
+MB = 1024 * 1024
+
+# size bound per cache in megabytes, overridable with AIUR_CACHE_SIZE
+DEFAULT_MAX_SIZE = 512
+
+
+def default_max_size():
+    return int(os.environ.get("AIUR_CACHE_SIZE", DEFAULT_MAX_SIZE)) * MB
+
+
+@lru_cache(maxsize=None)
+def compiler_version(cxx):
+    proc = subprocess.run([cxx, "--version"], capture_output=True, text=True)
+    return proc.stdout
+
+
+def stdlib_digest(include_path):
+    h = hashlib.sha256()
+    for mod in sorted(os.listdir(include_path)):
+        h.update(mod.encode() + b"\0")
+        with open(os.path.join(include_path, mod), "rb") as f:
+            h.update(f.read() + b"\0")
+    return h.hexdigest()
+
+
+def build_key(code, include_path, cxx, flags):
+    h = hashlib.sha256()
+    for part in (code, stdlib_digest(include_path), compiler_version(cxx), "\0".join(flags)):
+        h.update(part.encode() + b"\0")
+    return h.hexdigest()
+
+
+def copy_atomic(src, dst):
+    # copy next to the destination and rename over it, so readers never see
+    # a partial file and a running executable at dst is not overwritten
+    fd, tmp = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(dst)), prefix=".aiur-")
+    os.close(fd)
+    try:
+        shutil.copy(src, tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class Cache:
+    def __init__(self, name, max_size=None):
+        self.name = name
+        self.path = os.path.join(CACHE_PATH, name)
+        self.max_size = max_size if max_size is not None else default_max_size()
+
+    def entry(self, key):
+        return os.path.join(self.path, key)
+
+    def get(self, key):
+        path = self.entry(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def restore(self, key, dst):
+        path = self.get(key)
+        if path is None:
+            return False
+        copy_atomic(path, dst)
+        return True
+
+    def put(self, key, src):
+        os.makedirs(self.path, exist_ok=True)
+        copy_atomic(src, self.entry(key))
+        self.evict()
+
+    def read(self, key):
+        path = self.get(key)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def write(self, key, data):
+        os.makedirs(self.path, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix=".aiur-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self.entry(key))
+        self.evict()
+
+    def discard(self, key):
+        try:
+            os.unlink(self.entry(key))
+        except FileNotFoundError:
+            pass
+
+    def entries(self):
+        if not os.path.isdir(self.path):
+            return []
+
+        entries = []
+        for name in os.listdir(self.path):
+            if name.startswith("."):
+                continue
+            try:
+                st = os.stat(os.path.join(self.path, name))
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+        return entries
+
+    def evict(self):
+        entries = sorted(self.entries())
+        size = sum(entry[1] for entry in entries)
+
+        for _, entry_size, name in entries:
+            if size <= self.max_size:
+                break
+            try:
+                os.unlink(os.path.join(self.path, name))
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+
+    def stats(self):
+        entries = self.entries()
+        return len(entries), sum(entry[1] for entry in entries)
+
+    def clear(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+CACHES = ["build", "objects", "pch", "frontend", "pgo"]
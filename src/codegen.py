@@ -1,24 +1,59 @@
-import os
-import re
+from dataclasses import fields
+
 import ctx
+import stdlib_index
+from expr import AssignExpr, BinaryExpr, CallExpr, Expr, ForStmt, FunctionStmt, GroupingExpr, ImportStmt, LiteralExpr, ReturnStmt, Stmt, VarStmt, VariableExpr
+from infer import STRING, cpp_type
+from lexer import TokenType
+from modules import header_name
+from optimizer import referenced_names
 
 
 class CompileError(Exception):
     pass
 
 
+# always included, it carries the runtime support generated code relies on
+CORE_MODULE = "std.h"
+
+# reduce clause operation -> the par.h type that implements it
+REDUCTIONS = {"sum": "par::Sum", "min": "par::Min", "max": "par::Max"}
+
+
 class CodeGenerator:
-    def __init__(self, ctx):
+    def __init__(self, ctx, out=None, include_all=False, intern_strings=True, types=None, namespace=None, imports=None):
         self.ctx = ctx
-        self.out = ""
-        self.mods = os.listdir(self.ctx.include_path)
+        self.chunks = []
+        # with an output file, fragments are streamed to it instead of kept
+        self.write = out.write if out is not None else self.chunks.append
+        self.index = stdlib_index.load(self.ctx.include_path)
+        self.mods = list(self.index)
         self.symbols = set()
+        self.exports = {}
+        self.include_all = include_all
+        self.used_mods = {CORE_MODULE}
+        self.intern_strings = intern_strings
+        # literal -> name of the constant it is interned as
+        self.literals = {}
+        self.literal_prefix = "s"
+        # inferred types, declarations without one are left to templates
+        # and auto
+        self.types = types
+        # namespace of the module being compiled, None for the program
+        self.namespace = namespace
+        # namespace of each imported module -> the functions it defines
+        self.imports = imports or {}
 
     def compile(self, statements):
-        for mod in self.mods:
-            self.symbols.update(self.get_mod_symbols(mod))
-            self.out += "#include \"%s\"\n" % mod
-        self.out += "\n"
+        self.register_symbols()
+
+        # the includes and interned literals come first, so what the code
+        # references is collected up front and the code itself can be
+        # streamed out
+        self.prescan(statements)
+        self.emit_includes()
+        if self.literals:
+            self.emit_literals(self.literals, "static")
 
         for stmt in statements:
             self.compile_stmt(stmt)
@@ -26,7 +61,119 @@ class CodeGenerator:
         if "main" not in self.symbols:
             ctx.error("main function isn't defined", self.ctx)
 
-        return self.out
+        return "".join(self.chunks)
+
+    def prescan(self, statements):
+        # Marks the stdlib symbols the statements use and interns their
+        # string literals, the same as compiling them does. A num::range
+        # lowered to a counted loop doesn't use num::range. Nodes are visited
+        # in source order, literals are numbered like compiling numbers them.
+        stack = list(reversed(statements))
+        while stack:
+            node = stack.pop()
+            if isinstance(node, list):
+                stack.extend(reversed(node))
+                continue
+            if not isinstance(node, (Expr, Stmt)):
+                continue
+
+            if isinstance(node, (VariableExpr, AssignExpr)):
+                self.use(node.name.lexeme)
+            elif isinstance(node, CallExpr):
+                self.use(node.callee.name.lexeme)
+            elif isinstance(node, LiteralExpr):
+                if isinstance(node.value, str) and self.intern_strings:
+                    self.intern(node.value)
+            elif isinstance(node, ForStmt):
+                if node.parallel:
+                    self.use("par::for_range")
+                if self.range_bounds(node.iterator) is not None:
+                    stack.append(node.body)
+                    stack.extend(reversed(node.iterator.arguments))
+                    continue
+            stack.extend(reversed([getattr(node, field.name) for field in fields(node)]))
+
+    def compile_module(self, statements):
+        # An imported module becomes a header and a source file, both in the
+        # module's namespace. Functions with concrete types are declared in
+        # the header and defined in the source, so the modules importing it
+        # only recompile when a signature changes. Templates and functions
+        # returning auto are defined in the header, callers need to see them.
+        self.register_symbols()
+
+        declarations, definitions = [], []
+        header_literals, source_literals = {}, {}
+        for stmt in statements:
+            if isinstance(stmt, ImportStmt):
+                self.compile_stmt(stmt)
+                continue
+            if not isinstance(stmt, FunctionStmt):
+                ctx.error("modules can only contain imports and functions", self.ctx)
+
+            if self.is_concrete(stmt):
+                self.write = declarations.append
+                self.emit_signature(stmt, "")
+                self.emitln(";")
+                self.write = definitions.append
+                self.literals, self.literal_prefix = source_literals, "s"
+            else:
+                self.write = declarations.append
+                self.literals, self.literal_prefix = header_literals, "h"
+            self.compile_stmt(stmt)
+
+        header = []
+        self.write = header.append
+        self.emitln("#pragma once")
+        self.emit_includes()
+        self.emitln(f"namespace {self.namespace} {{")
+        if header_literals:
+            self.emit_literals(header_literals, "inline")
+        self.write("".join(declarations))
+        self.emitln("}")
+
+        source = []
+        self.write = source.append
+        self.emitln(f"#include \"{header_name(self.namespace)}\"")
+        self.emitln()
+        self.emitln(f"namespace {self.namespace} {{")
+        if source_literals:
+            self.emit_literals(source_literals, "static")
+        self.write("".join(definitions))
+        self.emitln("}")
+        return "".join(header), "".join(source)
+
+    def register_symbols(self):
+        for mod in self.mods:
+            for symbol in self.index[mod].symbols:
+                self.exports[symbol] = mod
+        self.symbols.update(self.exports)
+        for namespace, functions in self.imports.items():
+            self.symbols.update(f"{namespace}::{name}" for name in functions)
+
+    def included_mods(self):
+        # the stdlib modules the generated code includes
+        used_mods = stdlib_index.dependencies(self.index, self.used_mods)
+        return [mod for mod in self.mods if self.include_all or mod in used_mods]
+
+    def emit_includes(self):
+        for mod in self.included_mods():
+            self.emitln("#include \"%s\"" % mod)
+        self.emitln()
+
+        # after the stdlib includes, the precompiled header only covers those
+        if self.imports:
+            for namespace in self.imports:
+                self.emitln(f"#include \"{header_name(namespace)}\"")
+            self.emitln()
+
+    def emit_literals(self, literals, specifier):
+        # constructed once at startup, evaluating a literal no longer
+        # allocates a new string
+        self.emitln("namespace _literals {")
+        for value, name in literals.items():
+            self.emitln(f"{specifier} const std::string {name}(\"{value}\");")
+        self.emitln("}")
+        self.emitln()
 
     def compile_stmt(self, stmt):
         return stmt.accept(self)
@@ -46,7 +193,7 @@ class CodeGenerator:
 
         if stmt.else_branch is not None:
             self.emitln()
-            self.emit("else")
+            self.emit("else ")
             self.compile_stmt(stmt.else_branch)
         self.emitln()
 
@@ -57,6 +204,15 @@ class CodeGenerator:
         self.compile_expr(stmt.body)
 
     def visit_for_stmt(self, stmt):
+        bounds = self.range_bounds(stmt.iterator)
+        if stmt.parallel:
+            if bounds is None:
+                ctx.error("for par needs a num::range iterator with a constant step",
+                          self.ctx, stmt.variable.pos)
+            return self.emit_parallel_for(stmt, *bounds)
+        if bounds is not None:
+            return self.emit_counted_for(stmt, *bounds)
+
         self.emit("for (auto ")
         self.emit(stmt.variable.lexeme)
         self.symbols.add(stmt.variable.lexeme)
@@ -65,24 +221,168 @@ class CodeGenerator:
         self.emit(") ")
         self.compile_expr(stmt.body)
 
-    def visit_function_stmt(self, stmt):
-        self.symbols.add(stmt.name.lexeme)
+    def range_bounds(self, expr):
+        # (start, end, step) of a `num::range` call that can become a counted
+        # loop, the step has to be a constant so the comparison is known
+        if not isinstance(expr, CallExpr) or not isinstance(expr.callee, VariableExpr):
+            return None
+        if expr.callee.name.lexeme != "num::range" or "num::range" not in self.exports:
+            return None
+
+        args = expr.arguments
+        if len(args) == 1:
+            return None, args[0], 1
+        if len(args) == 2:
+            return args[0], args[1], 1
+        if len(args) == 3 and isinstance(args[2], LiteralExpr) \
+                and type(args[2].value) is int and args[2].value != 0:
+            return args[0], args[1], args[2].value
+        return None
+
+    def emit_counted_for(self, stmt, start, end, step):
+        name = stmt.variable.lexeme
+        self.symbols.add(name)
+
+        # the loop runs on a hidden counter and the variable is a copy of it,
+        # so assigning to it in the body doesn't change the iteration, the
+        # same as iterating over the materialized range did
+        self.emit(f"for (int64_t _{name} = ")
+        if start is None:
+            self.emit("0")
+        else:
+            self.compile_expr(start)
+        self.emit(f", _{name}_end = ")
+        self.compile_expr(end)
+        self.emit(f"; _{name} {'<' if step > 0 else '>'} _{name}_end; _{name} += {step}) ")
+        self.emitln("{")
+        self.emitln(f"auto {name} = _{name};")
+        self.compile_stmt(stmt.body)
+        self.emitln("}")
+
+    def emit_parallel_for(self, stmt, start, end, step):
+        # The body becomes a lambda that par::for_range calls with the bounds
+        # of a chunk of iterations. Reduction variables get a copy per chunk
+        # that is merged into the shared variable when the chunk is done. The
+        # copies start from a snapshot taken before the loop, the shared
+        # variable itself is being merged into by other chunks.
+        name = stmt.variable.lexeme
+        self.check_parallel_body(stmt)
+        self.symbols.add(name)
+        if "par::for_range" not in self.exports:
+            ctx.error("for par needs par.h in the stdlib", self.ctx, stmt.variable.pos)
+        self.use("par::for_range")
+
+        self.emitln("{")
+        for reduction in stmt.reductions:
+            var = reduction.variable.lexeme
+            self.emitln(f"auto &_{var}_shared = {var};")
+            self.emitln(f"const auto _{var}_init = {var};")
+        self.emit("par::for_range(")
+        if start is None:
+            self.emit("0")
+        else:
+            self.compile_expr(start)
+        self.emit(", ")
+        self.compile_expr(end)
+        self.emitln(f", {step}, [&](long _{name}, long _{name}_end) {{")
+        for reduction in stmt.reductions:
+            var = reduction.variable.lexeme
+            self.emitln(f"auto {var} = {REDUCTIONS[reduction.op.lexeme]}::identity(_{var}_init);")
+        self.emitln(f"for (; _{name} {'<' if step > 0 else '>'} _{name}_end; _{name} += {step}) {{")
+        self.emitln(f"auto {name} = _{name};")
+        self.compile_stmt(stmt.body)
+        self.emitln("}")
+        for reduction in stmt.reductions:
+            var = reduction.variable.lexeme
+            self.emitln(f"par::reduce<{REDUCTIONS[reduction.op.lexeme]}>(_{var}_shared, {var});")
+        self.emitln("});")
+        self.emitln("}")
 
-        if len(stmt.params) > 0:
+    def check_parallel_body(self, stmt):
+        # a return would only end the chunk's lambda, and a variable from
+        # outside the loop assigned in it would be written by several threads
+        for reduction in stmt.reductions:
+            if reduction.variable.lexeme not in self.symbols:
+                ctx.error(f"undefined variable: {reduction.variable.lexeme}",
+                          self.ctx, reduction.variable.pos)
+
+        private = {stmt.variable.lexeme}
+        private.update(reduction.variable.lexeme for reduction in stmt.reductions)
+        assigned = []
+        stack = [stmt.body]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, list):
+                stack.extend(node)
+            elif isinstance(node, (Expr, Stmt)):
+                if isinstance(node, ReturnStmt):
+                    ctx.error("can't return from a for par loop", self.ctx, node.keyword.pos)
+                elif isinstance(node, VarStmt):
+                    private.add(node.name.lexeme)
+                elif isinstance(node, ForStmt):
+                    private.add(node.variable.lexeme)
+                elif isinstance(node, AssignExpr):
+                    assigned.append(node.name)
+                stack.extend(getattr(node, field.name) for field in fields(node))
+
+        for name in assigned:
+            if name.lexeme not in private:
+                ctx.error(f"{name.lexeme} is shared by the iterations of a for par loop, "
+                          "declare it in the loop or reduce it", self.ctx, name.pos)
+
+    def function_types(self, stmt):
+        # C++ types of the parameters and the return value, None where none
+        # was inferred
+        if self.types is None:
+            return [None] * len(stmt.params), None
+        name = stmt.name.lexeme
+        if self.namespace is not None:
+            name = f"{self.namespace}::{name}"
+        params = [cpp_type(typ) for typ in self.types.params[name]]
+        return params, cpp_type(self.types.returns[name])
+
+    def is_concrete(self, stmt):
+        params, returns = self.function_types(stmt)
+        return returns is not None and None not in params
+
+    def emit_signature(self, stmt, specifier):
+        # parameters without an inferred type become template parameters
+        name = stmt.name.lexeme
+        params, returns = self.function_types(stmt)
+        templated = [f"T{i}" for i, typ in enumerate(params) if typ is None]
+        params = [typ or f"T{i}" for i, typ in enumerate(params)]
+
+        if templated:
             self.emit(f"template <")
-            self.emit(
-                ", ".join([f"typename T{i}" for i in range(len(stmt.params))]))
+            self.emit(", ".join(f"typename {typ}" for typ in templated))
             self.emitln(">")
 
-        self.emit("auto " if stmt.name.lexeme != "main" else "int ")
-        self.emit(stmt.name.lexeme)
+        if name == "main":
+            self.emit("int ")
+        else:
+            self.emit(f"{specifier}{returns or 'auto'} ")
+        self.emit(name)
 
-        self.symbols.update(param.lexeme for param in stmt.params)
         self.emit("(")
-        self.emit(",".join(f"T{i} {param.lexeme}" for i,
-                           param in enumerate(stmt.params)))
+        self.emit(",".join(f"{typ} {param.lexeme}" for typ,
+                           param in zip(params, stmt.params)))
         self.emit(")")
 
+    def visit_function_stmt(self, stmt):
+        self.symbols.add(stmt.name.lexeme)
+
+        if self.namespace is not None:
+            # defined in the header unless the types are concrete
+            specifier = "" if self.is_concrete(stmt) else "inline "
+        elif None in self.function_types(stmt)[0]:
+            specifier = ""
+        else:
+            # internal linkage lets g++ drop functions it inlined everywhere,
+            # like it does with template instantiations
+            specifier = "static "
+        self.emit_signature(stmt, specifier)
+        self.symbols.update(param.lexeme for param in stmt.params)
+
         self.emitln("{")
         for s in stmt.body.statements:
             self.compile_stmt(s)
@@ -98,7 +398,8 @@ class CodeGenerator:
     def visit_var_stmt(self, stmt):
         self.symbols.add(stmt.name.lexeme)
 
-        self.emit("auto ")
+        typ = cpp_type(self.types.variables[id(stmt)]) if self.types is not None else None
+        self.emit(f"{typ or 'auto'} ")
         self.emit(stmt.name.lexeme)
         if stmt.initializer is not None:
             self.emit(" = ")
@@ -116,16 +417,35 @@ class CodeGenerator:
         self.compile_stmt(stmt.block)
         self.emitln(");")
 
+    def visit_import_stmt(self, stmt):
+        if stmt.name.lexeme not in self.imports:
+            ctx.error(f"module {stmt.name.lexeme} wasn't compiled with this program",
+                      self.ctx, stmt.name.pos)
+
     def visit_literal(self, expr):
         if isinstance(expr.value, bool):
             self.emit("true" if expr.value else "false")
         elif isinstance(expr.value, (int, float)):
-            self.emit(str(expr.value))
+            value = str(expr.value)
+            # with types, integers are int64_t like the variables they go in
+            if self.types is not None and isinstance(expr.value, int):
+                value = f"INT64_C({value})"
+            # parenthesized so that `a - -1` doesn't become `a--1`
+            self.emit(value if expr.value >= 0 else f"({value})")
         elif isinstance(expr.value, str):
-            self.emit(f"std::string(\"{expr.value}\")")
+            if not self.intern_strings:
+                self.emit(f"std::string(\"{expr.value}\")")
+                return
+            self.emit(f"_literals::{self.intern(expr.value)}")
         else:
             assert False, "unreachable"
 
+    def intern(self, value):
+        name = self.literals.get(value)
+        if name is None:
+            name = self.literals[value] = f"{self.literal_prefix}{len(self.literals)}"
+        return name
+
     def visit_grouping(self, expr):
         self.emit("(")
         self.compile_expr(expr.expr)
@@ -134,11 +454,27 @@ class CodeGenerator:
     def visit_variable(self, expr):
         if not expr.name.lexeme in self.symbols:
             ctx.error(f"undefined variable: {expr.name.lexeme}", self.ctx, expr.name.pos)
+        self.use(expr.name.lexeme)
         self.emit(expr.name.lexeme)
 
     def visit_assign(self, expr):
         if not expr.name.lexeme in self.symbols:
             ctx.error(f"undefined variable: {expr.name.lexeme}", self.ctx, expr.name.pos)
+        self.use(expr.name.lexeme)
+
+        operands = self.append_operands(expr)
+        if operands is not None:
+            # extend the variable in place instead of copying it into a new
+            # value on every assignment
+            self.emit("(")
+            for i, operand in enumerate(operands):
+                if i > 0:
+                    self.emit(", ")
+                self.emit(expr.name.lexeme)
+                self.emit(" += ")
+                self.compile_expr(operand)
+            self.emit(")")
+            return
 
         self.emit("(")
         self.emit(expr.name.lexeme)
@@ -146,23 +482,59 @@ class CodeGenerator:
         self.compile_expr(expr.value)
         self.emit(")")
 
+    def append_operands(self, expr):
+        # the operands of `x = x + a + b + ...`, if it can be written as
+        # `x += a, x += b, ...`
+        name = expr.name.lexeme
+        operands = []
+        value = expr.value
+        while True:
+            while isinstance(value, GroupingExpr):
+                value = value.expr
+            if not isinstance(value, BinaryExpr) or value.op.typ != TokenType.PLUS:
+                break
+            operands.append(value.right)
+            value = value.left
+
+        if not isinstance(value, VariableExpr) or value.name.lexeme != name or not operands:
+            return None
+        operands.reverse()
+
+        # only appending to a string means the same thing, `s += 5` appends
+        # a character where `s = s + 5` doesn't compile. Every partial sum of
+        # a string is a string too, so a chain can be split. The later
+        # operands must not see the partially extended x.
+        if not self.is_string_sum(expr, operands):
+            return None
+        if any(name in referenced_names(op) for op in operands[1:]):
+            return None
+        return operands
+
+    def is_string_sum(self, expr, operands):
+        # inferred as one, or a string literal in the sum proves x is one
+        if self.types is not None and self.types.assigns.get(id(expr)) == STRING:
+            return True
+        return any(isinstance(op, LiteralExpr) and isinstance(op.value, str) for op in operands)
+
     def visit_unary(self, expr):
+        self.emit("(")
         self.emit(expr.op.lexeme)
         self.compile_expr(expr.right)
+        self.emit(")")
 
     def visit_call(self, expr):
         function = expr.callee.name.lexeme
 
         if not function in self.symbols:
             ctx.error(f"undefined function: {function}", self.ctx, expr.callee.name.pos)
+        self.use(function)
 
         self.emit(function)
         self.emit("(")
-        if expr.arguments:
-            for arg in expr.arguments:
-                self.compile_expr(arg)
+        for i, arg in enumerate(expr.arguments):
+            if i > 0:
                 self.emit(",")
-            self.out = self.out[:-1]
+            self.compile_expr(arg)
         self.emit(")")
 
     def visit_binary(self, expr):
@@ -172,19 +544,13 @@ class CodeGenerator:
         self.compile_expr(expr.right)
         self.emit(")")
 
+    def use(self, symbol):
+        mod = self.exports.get(symbol)
+        if mod is not None:
+            self.used_mods.add(mod)
+
     def emit(self, code):
-        self.out += code
+        self.write(code)
 
     def emitln(self, code=""):
         self.emit(code+"\n")
-
-    def get_mod_symbols(self, mod):
-        symbols = set()
-
-        with open(os.path.join(self.ctx.include_path, mod)) as f:
-            matches = re.finditer(
-                r"\/\/(\s+)?export ([a-zA-Z0-9:_]+)", f.read(), re.MULTILINE)
-
-            for match in matches:
-                symbols.add(match.group(2))
-        return symbols
@@ -1,4 +1,6 @@
-from dataclasses import dataclass
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from typing import List
 
 
 @dataclass
@@ -6,6 +8,29 @@ class Context:
     file: str
     src: str
     include_path: str
+    line_starts: List[int] = field(
+        default=None, init=False, repr=False, compare=False)
+
+    def line_index(self):
+        if self.line_starts is None:
+            starts = [0]
+            find = self.src.find
+            i = find("\n")
+            while i != -1:
+                starts.append(i + 1)
+                i = find("\n", i + 1)
+            self.line_starts = starts
+        return self.line_starts
+
+    def position(self, offset):
+        starts = self.line_index()
+        line = bisect_right(starts, offset)
+        return (line, offset - starts[line-1])
+
+    def source_line(self, line):
+        starts = self.line_index()
+        end = starts[line] - 1 if line < len(starts) else len(self.src)
+        return self.src[starts[line-1]:end]
 
 
 def error(msg, ctx, pos=None):
@@ -14,7 +39,7 @@ def error(msg, ctx, pos=None):
     if pos is not None:
         pos_str += f":{pos[0]}:{pos[1]}"
 
-        line = ctx.src.split("\n")[pos[0]-1]
+        line = ctx.source_line(pos[0])
         print("\033[31m"+pos_str+":\033[0m "+line)
 
         pad_length = len(pos_str) + 2 + pos[1]
@@ -1,14 +1,14 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 from typing import Any, List
 
 from lexer import Token
 
 
 class Expr:
-    pass
+    __slots__ = ()
 
 
-@dataclass
+@dataclass(slots=True)
 class BinaryExpr(Expr):
     left: Expr
     op: Token
@@ -18,7 +18,7 @@ class BinaryExpr(Expr):
         return acceptor.visit_binary(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class GroupingExpr(Expr):
     expr: Expr
 
@@ -26,7 +26,7 @@ class GroupingExpr(Expr):
         return acceptor.visit_grouping(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class LiteralExpr(Expr):
     value: Any
 
@@ -34,7 +34,7 @@ class LiteralExpr(Expr):
         return acceptor.visit_literal(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class UnaryExpr(Expr):
     op: Token
     right: Expr
@@ -43,7 +43,7 @@ class UnaryExpr(Expr):
         return acceptor.visit_unary(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class VariableExpr(Expr):
     name: Token
 
@@ -51,7 +51,7 @@ class VariableExpr(Expr):
         return acceptor.visit_variable(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class AssignExpr(Expr):
     name: Token
     value: Expr
@@ -60,7 +60,7 @@ class AssignExpr(Expr):
         return acceptor.visit_assign(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class CallExpr(Expr):
     callee: Expr
     paren: Token
@@ -71,10 +71,10 @@ class CallExpr(Expr):
 
 
 class Stmt:
-    pass
+    __slots__ = ()
 
 
-@dataclass
+@dataclass(slots=True)
 class ExpressionStmt(Stmt):
     expr: Expr
 
@@ -82,7 +82,7 @@ class ExpressionStmt(Stmt):
         return acceptor.visit_expression_stmt(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class IfStmt(Stmt):
     condition: Expr
     then_branch: Stmt
@@ -92,7 +92,7 @@ class IfStmt(Stmt):
         return acceptor.visit_if_stmt(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class WhileStmt(Stmt):
     condition: Expr
     body: Stmt
@@ -101,17 +101,27 @@ class WhileStmt(Stmt):
         return acceptor.visit_while_stmt(self)
 
 
-@dataclass
+@dataclass(slots=True)
+class Reduction:
+    # sum, min or max
+    op: Token
+    variable: Token
+
+
+@dataclass(slots=True)
 class ForStmt(Stmt):
     variable: Token
     iterator: Expr
     body: Stmt
+    # `for par`, iterations may run concurrently
+    parallel: bool
+    reductions: List[Reduction]
 
     def accept(self, acceptor):
         return acceptor.visit_for_stmt(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class FunctionStmt(Stmt):
     name: Token
     params: List[Token]
@@ -121,7 +131,7 @@ class FunctionStmt(Stmt):
         return acceptor.visit_function_stmt(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class VarStmt(Stmt):
     name: Token
     initializer: Expr
@@ -130,7 +140,7 @@ class VarStmt(Stmt):
         return acceptor.visit_var_stmt(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class ReturnStmt(Stmt):
     keyword: Token
     value: Expr
@@ -139,7 +149,7 @@ class ReturnStmt(Stmt):
         return acceptor.visit_return_stmt(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class BlockStmt(Stmt):
     statements: List[Stmt]
 
@@ -147,9 +157,33 @@ class BlockStmt(Stmt):
         return acceptor.visit_block_stmt(self)
 
 
-@dataclass
+@dataclass(slots=True)
 class DeferStmt(Stmt):
     block: Stmt
 
     def accept(self, acceptor):
         return acceptor.visit_defer_stmt(self)
+
+
+@dataclass(slots=True)
+class ImportStmt(Stmt):
+    keyword: Token
+    # `geometry` or `shapes::circle`, the module in geometry.aiur or
+    # shapes/circle.aiur in the program's directory
+    name: Token
+
+    def accept(self, acceptor):
+        return acceptor.visit_import_stmt(self)
+
+
+def count_nodes(statements):
+    count = 0
+    stack = list(statements)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, (Expr, Stmt)):
+            count += 1
+            stack.extend(getattr(node, field.name) for field in fields(node))
+    return count
@@ -0,0 +1,117 @@
+import gc
+import hashlib
+import marshal
+import os
+from dataclasses import fields
+
+import expr
+from cache import Cache
+from lexer import Token, TokenType
+
+FORMAT_VERSION = 1
+
+NODES = [
+    expr.BinaryExpr,
+    expr.GroupingExpr,
+    expr.LiteralExpr,
+    expr.UnaryExpr,
+    expr.VariableExpr,
+    expr.AssignExpr,
+    expr.CallExpr,
+    expr.ExpressionStmt,
+    expr.IfStmt,
+    expr.WhileStmt,
+    expr.ForStmt,
+    expr.FunctionStmt,
+    expr.VarStmt,
+    expr.ReturnStmt,
+    expr.BlockStmt,
+    expr.DeferStmt,
+    expr.Reduction,
+    expr.ImportStmt,
+]
+NODE_IDS = {cls: i for i, cls in enumerate(NODES)}
+NODE_FIELDS = [tuple(field.name for field in fields(cls)) for cls in NODES]
+
+TOKEN_TAG = -1
+TOKEN_TYPES = {typ.value: typ for typ in TokenType}
+
+_version = None
+
+
+def frontend_version():
+    # any change to the lexer, parser or AST definitions invalidates entries
+    global _version
+    if _version is None:
+        h = hashlib.sha256(str(FORMAT_VERSION).encode())
+        src_path = os.path.dirname(__file__)
+        for name in ("lexer.py", "parser.py", "expr.py", "frontend_cache.py"):
+            with open(os.path.join(src_path, name), "rb") as f:
+                h.update(f.read())
+        _version = h.hexdigest()
+    return _version
+
+
+def source_key(src):
+    h = hashlib.sha256(frontend_version().encode() + b"\0")
+    h.update(src.encode())
+    return h.hexdigest()
+
+
+# Nodes are encoded as tuples (node id, *fields), tokens as tuples
+# (TOKEN_TAG, type, lexeme, literal, pos) and lists as lists, which marshal
+# stores compactly and loads without executing anything.
+
+def encode(value):
+    cls = type(value)
+    node_id = NODE_IDS.get(cls)
+    if node_id is not None:
+        return (node_id, *(encode(getattr(value, name)) for name in NODE_FIELDS[node_id]))
+    if cls is list:
+        return [encode(item) for item in value]
+    if value is None or cls in (bool, int, float, str):
+        return value
+    # Token or TokenRef
+    return (TOKEN_TAG, value.typ.value, value.lexeme, value.literal, tuple(value.pos))
+
+
+def decode(value):
+    cls = type(value)
+    if cls is tuple:
+        tag = value[0]
+        if tag == TOKEN_TAG:
+            return Token(TOKEN_TYPES[value[1]], value[2], value[3], value[4])
+        return NODES[tag](*map(decode, value[1:]))
+    if cls is list:
+        return list(map(decode, value))
+    return value
+
+
+def load_statements(ctx):
+    cache = Cache("frontend")
+    key = source_key(ctx.src)
+    data = cache.read(key)
+    if data is None:
+        return None
+
+    # decoding allocates lots of acyclic objects, collections would only
+    # slow it down
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return decode(marshal.loads(data))
+    except (EOFError, ValueError, TypeError, IndexError, KeyError, RecursionError):
+        cache.discard(key)
+        return None
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def store_statements(ctx, statements):
+    try:
+        data = marshal.dumps(encode(statements))
+    except (ValueError, RecursionError):
+        # too deeply nested to serialize, just don't cache it
+        return
+    Cache("frontend").write(source_key(ctx.src), data)
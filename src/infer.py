@@ -0,0 +1,305 @@
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+from expr import CallExpr, FunctionStmt, VariableExpr
+from lexer import TokenType
+
+# Types are INT, FLOAT, BOOL, STRING, ("vector", element type) or ANY when
+# they can't be inferred. None means nothing is known yet, it only exists
+# while the pass runs.
+INT = "int"
+FLOAT = "float"
+BOOL = "bool"
+STRING = "string"
+ANY = "any"
+
+CPP_TYPES = {
+    INT: "int64_t",
+    FLOAT: "double",
+    BOOL: "bool",
+    STRING: "std::string",
+}
+
+# C++ return types of stdlib functions and the types they are inferred as
+STDLIB_TYPES = {
+    "int": INT,
+    "long": INT,
+    "long long": INT,
+    "size_t": INT,
+    "int64_t": INT,
+    "float": FLOAT,
+    "double": FLOAT,
+    "bool": BOOL,
+    "std::string": STRING,
+}
+
+VECTOR_RE = re.compile(r"std::vector<(.+)>")
+
+COMPARISONS = {TokenType.EQ, TokenType.NEQ, TokenType.GT, TokenType.GE, TokenType.LT, TokenType.LE}
+ARITHMETIC = {TokenType.PLUS, TokenType.MINUS, TokenType.STAR, TokenType.SLASH, TokenType.MOD}
+
+
+def join(a, b):
+    if a is None:
+        return b
+    if b is None or a == b:
+        return a
+    return ANY
+
+
+def cpp_type(typ):
+    # the C++ spelling of a type, None if it has to be left to the compiler
+    if isinstance(typ, tuple):
+        element = cpp_type(typ[1])
+        return f"std::vector<{element}>" if element is not None else None
+    return CPP_TYPES.get(typ)
+
+
+def stdlib_type(cpp):
+    vector = VECTOR_RE.fullmatch(cpp)
+    if vector is not None:
+        element = stdlib_type(vector.group(1))
+        return ("vector", element) if element != ANY else ANY
+    return STDLIB_TYPES.get(cpp, ANY)
+
+
+@dataclass
+class Types:
+    # id() of a VarStmt -> type of the variable
+    variables: Dict[int, Any] = field(default_factory=dict)
+    # function name, qualified with the namespace of its module, -> types
+    # of its parameters
+    params: Dict[str, List[Any]] = field(default_factory=dict)
+    # qualified function name -> type of what it returns
+    returns: Dict[str, Any] = field(default_factory=dict)
+    # id() of an AssignExpr -> type of the value it assigns
+    assigns: Dict[int, Any] = field(default_factory=dict)
+
+    def count(self):
+        # declarations that got a concrete type
+        types = [*self.variables.values(), *self.returns.values(),
+                 *(typ for params in self.params.values() for typ in params)]
+        return sum(cpp_type(typ) is not None for typ in types)
+
+
+class TypeInference:
+    # Infers the types of variables, parameters and return values. Parameter
+    # types are joined over every call site and the program is walked until
+    # nothing changes, so a type only becomes concrete if every value that
+    # can reach it agrees. Anything else stays ANY and is left to templates
+    # and auto. Imported modules are inferred together with the program, so
+    # calls from other modules count too.
+    def __init__(self, index):
+        self.stdlib = {}
+        for mod in index.values():
+            for symbol, cpp in mod.returns.items():
+                self.stdlib[symbol] = stdlib_type(cpp)
+        self.types = Types()
+        self.function = None
+        self.prefix = ""
+
+    def infer(self, modules):
+        # modules are (namespace, statements) pairs, the namespace is None
+        # for the program itself
+        for namespace, statements in modules:
+            self.enter(namespace)
+            for stmt in statements:
+                if isinstance(stmt, FunctionStmt):
+                    name = self.qualify(stmt.name.lexeme)
+                    self.types.params[name] = [None] * len(stmt.params)
+                    self.types.returns[name] = None
+
+        while True:
+            before = self.snapshot()
+            for namespace, statements in modules:
+                self.enter(namespace)
+                self.scopes = [{}]
+                for stmt in statements:
+                    stmt.accept(self)
+            if self.snapshot() == before:
+                break
+
+        types = self.types
+        for params in types.params.values():
+            params[:] = [ANY if typ is None else typ for typ in params]
+        for name, typ in types.returns.items():
+            types.returns[name] = ANY if typ is None else typ
+        for key, typ in types.variables.items():
+            types.variables[key] = ANY if typ is None else typ
+        return types
+
+    def snapshot(self):
+        types = self.types
+        return (dict(types.variables), {name: list(params) for name, params in types.params.items()},
+                dict(types.returns))
+
+    def enter(self, namespace):
+        self.prefix = f"{namespace}::" if namespace is not None else ""
+
+    def qualify(self, name):
+        return self.prefix + name
+
+    def resolve(self, name):
+        # calls inside a module reach its own functions without the namespace
+        qualified = self.qualify(name)
+        return qualified if qualified in self.types.params else name
+
+    def declare(self, name, typ, stmt=None):
+        # stmt is the VarStmt of a variable without an initializer, its
+        # type is joined over what is assigned to it
+        self.scopes[-1][name] = [typ, stmt]
+
+    def lookup(self, name):
+        for scope in reversed(self.scopes):
+            if name in scope:
+                return scope[name]
+        return None
+
+    def block(self, statements):
+        self.scopes.append({})
+        for stmt in statements:
+            stmt.accept(self)
+        self.scopes.pop()
+
+    def visit_expression_stmt(self, stmt):
+        stmt.expr.accept(self)
+
+    def visit_if_stmt(self, stmt):
+        stmt.condition.accept(self)
+        self.block([stmt.then_branch])
+        if stmt.else_branch is not None:
+            self.block([stmt.else_branch])
+
+    def visit_while_stmt(self, stmt):
+        stmt.condition.accept(self)
+        self.block([stmt.body])
+
+    def visit_for_stmt(self, stmt):
+        iterator = stmt.iterator.accept(self)
+        if stmt.parallel or self.is_range(stmt.iterator):
+            typ = INT
+        elif isinstance(iterator, tuple):
+            typ = iterator[1]
+        elif iterator is None:
+            typ = None
+        else:
+            typ = ANY
+
+        self.scopes.append({})
+        self.declare(stmt.variable.lexeme, typ)
+        self.block([stmt.body])
+        self.scopes.pop()
+
+    def is_range(self, expr):
+        return isinstance(expr, CallExpr) and isinstance(expr.callee, VariableExpr) \
+            and expr.callee.name.lexeme == "num::range"
+
+    def visit_function_stmt(self, stmt):
+        self.function = self.qualify(stmt.name.lexeme)
+        # functions declared inside blocks weren't registered up front
+        params = self.types.params.setdefault(self.function, [None] * len(stmt.params))
+        self.types.returns.setdefault(self.function, None)
+        self.scopes.append({})
+        for param, typ in zip(stmt.params, params):
+            self.declare(param.lexeme, typ)
+        self.block(stmt.body.statements)
+        self.scopes.pop()
+        self.function = None
+
+    def visit_return_stmt(self, stmt):
+        typ = stmt.value.accept(self) if stmt.value is not None else ANY
+        if self.function is not None:
+            returns = self.types.returns
+            returns[self.function] = join(returns[self.function], typ)
+
+    def visit_var_stmt(self, stmt):
+        if stmt.initializer is not None:
+            typ = stmt.initializer.accept(self)
+            self.declare(stmt.name.lexeme, typ)
+        else:
+            typ = self.types.variables.get(id(stmt))
+            self.declare(stmt.name.lexeme, typ, stmt)
+        self.types.variables[id(stmt)] = typ
+
+    def visit_block_stmt(self, stmt):
+        self.block(stmt.statements)
+
+    def visit_defer_stmt(self, stmt):
+        stmt.block.accept(self)
+
+    def visit_import_stmt(self, stmt):
+        pass
+
+    def visit_literal(self, expr):
+        if isinstance(expr.value, bool):
+            return BOOL
+        elif isinstance(expr.value, int):
+            return INT
+        elif isinstance(expr.value, float):
+            return FLOAT
+        return STRING
+
+    def visit_grouping(self, expr):
+        return expr.expr.accept(self)
+
+    def visit_variable(self, expr):
+        entry = self.lookup(expr.name.lexeme)
+        return entry[0] if entry is not None else ANY
+
+    def visit_assign(self, expr):
+        typ = expr.value.accept(self)
+        self.types.assigns[id(expr)] = typ
+        entry = self.lookup(expr.name.lexeme)
+        if entry is None:
+            return ANY
+        if entry[1] is not None:
+            entry[0] = join(entry[0], typ)
+            self.types.variables[id(entry[1])] = entry[0]
+        return entry[0]
+
+    def visit_unary(self, expr):
+        typ = expr.right.accept(self)
+        if expr.op.typ == TokenType.BANG:
+            return BOOL
+        return typ if typ in (INT, FLOAT, None) else ANY
+
+    def visit_binary(self, expr):
+        left = expr.left.accept(self)
+        right = expr.right.accept(self)
+        if left is None or right is None:
+            return None
+        if ANY in (left, right):
+            return ANY
+
+        typ = expr.op.typ
+        if typ in COMPARISONS:
+            return BOOL
+        if typ not in ARITHMETIC:
+            return ANY
+        if left == right == STRING and typ == TokenType.PLUS:
+            return STRING
+        if left == right == INT:
+            return INT
+        if {left, right} <= {INT, FLOAT} and typ != TokenType.MOD:
+            return FLOAT
+        return ANY
+
+    def visit_call(self, expr):
+        args = [arg.accept(self) for arg in expr.arguments]
+        name = self.resolve(expr.callee.name.lexeme)
+
+        params = self.types.params.get(name)
+        if params is not None:
+            if len(params) == len(args):
+                params[:] = [join(param, arg) for param, arg in zip(params, args)]
+            return self.types.returns[name]
+        return self.stdlib.get(name, ANY)
+
+
+def infer_types(statements, index):
+    return TypeInference(index).infer([(None, statements)])
+
+
+def infer_modules(modules, index):
+    return TypeInference(index).infer(modules)
@@ -1,6 +1,9 @@
+from array import array
+from bisect import bisect_right
 from dataclasses import dataclass
 from enum import Enum, auto
 from typing import Any, Tuple
+import re
 import ctx
 
 
@@ -42,6 +45,9 @@ class TokenType(Enum):
     FOR = auto()
     IN = auto()
     DEFER = auto()
+    PAR = auto()
+    REDUCE = auto()
+    IMPORT = auto()
 
     EOF = auto()
 
@@ -58,10 +64,51 @@ KEYWORDS = {
     "for": TokenType.FOR,
     "in": TokenType.IN,
     "defer": TokenType.DEFER,
+    "par": TokenType.PAR,
+    "reduce": TokenType.REDUCE,
+    "import": TokenType.IMPORT,
 }
 
 
-@dataclass
+OPERATORS = {
+    "(": TokenType.LPAREN,
+    ")": TokenType.RPAREN,
+    "{": TokenType.LBRACE,
+    "}": TokenType.RBRACE,
+    ",": TokenType.COMMA,
+    ".": TokenType.DOT,
+    "+": TokenType.PLUS,
+    "-": TokenType.MINUS,
+    "*": TokenType.STAR,
+    "/": TokenType.SLASH,
+    "%": TokenType.MOD,
+    ";": TokenType.SEMICOLON,
+    "!": TokenType.BANG,
+    "=": TokenType.ASSIGN,
+    "==": TokenType.EQ,
+    "!=": TokenType.NEQ,
+    ">": TokenType.GT,
+    "<": TokenType.LT,
+    ">=": TokenType.GE,
+    "<=": TokenType.LE,
+}
+
+TOKEN_RE = re.compile(r"""
+    (?P<space>[^\S\n]+)
+  | (?P<newline>\n)
+  | (?P<comment>//[^\n]*)
+  | (?P<string>"[^"]*"?)
+  | (?P<number>\d[\d.]*)
+  | (?P<identifier>[^\W\d_][\w:]*)
+  | (?P<operator>[=!<>]=|[(){},.+\-*/%;!=<>])
+  | (?P<unexpected>.)
+""", re.VERBOSE | re.DOTALL)
+
+
+TOKEN_TYPES = {typ.value: typ for typ in TokenType}
+
+
+@dataclass(slots=True)
 class Token:
     typ: TokenType
     lexeme: str
@@ -69,7 +116,172 @@ class Token:
     pos: Tuple[int, int]
 
 
+class TokenRef:
+    __slots__ = ("tokens", "index")
+
+    def __init__(self, tokens, index):
+        self.tokens = tokens
+        self.index = index
+
+    @property
+    def typ(self):
+        return TOKEN_TYPES[self.tokens.kinds[self.index]]
+
+    @property
+    def lexeme(self):
+        start = self.tokens.starts[self.index]
+        return self.tokens.ctx.src[start:start+self.tokens.lengths[self.index]]
+
+    @property
+    def literal(self):
+        typ = self.typ
+        if typ == TokenType.NUMBER:
+            return int(self.lexeme)
+        elif typ == TokenType.STRING:
+            return self.lexeme[1:-1].replace("\n", "\\n")
+        return None
+
+    @property
+    def pos(self):
+        return self.tokens.position(
+            self.tokens.starts[self.index] + self.tokens.lengths[self.index])
+
+    def __repr__(self):
+        return f"TokenRef({self.typ}, {self.lexeme!r}, {self.pos})"
+
+
+class TokenArray:
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.kinds = array("B")
+        self.starts = array("I")
+        self.lengths = array("I")
+        # spans of the string literals that contain newlines, in order
+        self.string_starts = array("I")
+        self.string_ends = array("I")
+
+    def append(self, typ, start, length):
+        self.kinds.append(typ.value)
+        self.starts.append(start)
+        self.lengths.append(length)
+
+    def position(self, end):
+        # The (line, column) the default lexer stores for a token ending at
+        # end. Newlines inside strings advance the line but not the column,
+        # so the column counts from the last line start outside a string.
+        starts = self.ctx.line_index()
+        line = bisect_right(starts, end)
+        offset = end
+        while True:
+            line_start = starts[bisect_right(starts, offset) - 1]
+            i = bisect_right(self.string_starts, line_start - 1) - 1
+            if i < 0 or self.string_ends[i] < line_start:
+                return (line, end - line_start)
+            offset = self.string_starts[i]
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self.kinds)
+        return TokenRef(self, index)
+
+    def __iter__(self):
+        return (TokenRef(self, i) for i in range(len(self.kinds)))
+
+
 class Lexer:
+    def __init__(self, ctx, compact=False):
+        self.ctx = ctx
+        self.compact = compact
+        self.tokens = TokenArray(ctx) if compact else []
+
+    def scan_tokens(self):
+        if self.compact:
+            return self.scan_compact()
+
+        src = self.ctx.src
+        tokens = self.tokens
+        line = 1
+        line_start = 0
+
+        for m in TOKEN_RE.finditer(src):
+            kind = m.lastgroup
+            if kind == "space" or kind == "comment":
+                continue
+            if kind == "newline":
+                line += 1
+                line_start = m.end()
+                continue
+
+            lexeme = m.group()
+            end = m.end()
+
+            if kind == "identifier":
+                tokens.append(Token(KEYWORDS.get(lexeme, TokenType.IDENTIFIER),
+                                    lexeme, None, (line, end - line_start)))
+            elif kind == "operator":
+                tokens.append(Token(OPERATORS[lexeme], lexeme,
+                                    None, (line, end - line_start)))
+            elif kind == "number":
+                tokens.append(Token(TokenType.NUMBER, lexeme,
+                                    int(lexeme), (line, end - line_start)))
+            elif kind == "string":
+                # newlines inside a string advance the line but not the column
+                line += lexeme.count("\n")
+                if len(lexeme) < 2 or lexeme[-1] != "\"":
+                    ctx.error("unterminated string literal",
+                              self.ctx, (line, end - line_start))
+                tokens.append(Token(TokenType.STRING, lexeme, lexeme[1:-1].replace(
+                    "\n", "\\n"), (line, end - line_start)))
+            else:
+                ctx.error(f"unexpected character: {lexeme}",
+                          self.ctx, (line, end - line_start))
+
+        tokens.append(
+            Token(TokenType.EOF, "", None, (line, len(src) - line_start)))
+        return tokens
+
+    def scan_compact(self):
+        src = self.ctx.src
+        tokens = self.tokens
+        kinds, starts, lengths = tokens.kinds, tokens.starts, tokens.lengths
+
+        for m in TOKEN_RE.finditer(src):
+            kind = m.lastgroup
+            if kind == "space" or kind == "comment" or kind == "newline":
+                continue
+
+            start, end = m.span()
+
+            if kind == "identifier":
+                typ = KEYWORDS.get(m.group(), TokenType.IDENTIFIER)
+            elif kind == "operator":
+                typ = OPERATORS[m.group()]
+            elif kind == "number":
+                typ = TokenType.NUMBER
+            elif kind == "string":
+                if src.find("\n", start, end) != -1:
+                    tokens.string_starts.append(start)
+                    tokens.string_ends.append(end)
+                if end - start < 2 or src[end-1] != "\"":
+                    ctx.error("unterminated string literal",
+                              self.ctx, tokens.position(end))
+                typ = TokenType.STRING
+            else:
+                ctx.error(f"unexpected character: {m.group()}",
+                          self.ctx, tokens.position(end))
+
+            kinds.append(typ.value)
+            starts.append(start)
+            lengths.append(end - start)
+
+        tokens.append(TokenType.EOF, len(src), 0)
+        return tokens
+
+
+class CharLexer:
     def __init__(self, ctx):
         self.ctx = ctx
         self.tokens = []
@@ -167,7 +379,7 @@ class Lexer:
 
         if self.consume() != "\"":
             ctx.error("unterminated string literal",
-                        self.file, (self.line, self.pos))
+                      self.ctx, (self.line, self.pos))
 
         self.add_token(TokenType.STRING, value.replace("\n", "\\n"))
 
@@ -1,76 +1,540 @@
 #!/usr/bin/env python3
 import argparse
+import cProfile
+import marshal
+import shlex
 import subprocess
+import sys
 import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 
+from benchmark import bench_compiler
+from cache import CACHES, MB, Cache, build_key, copy_atomic
 from ctx import Context
+from expr import count_nodes
+from frontend_cache import load_statements, store_statements
+from infer import infer_modules, infer_types
 from lexer import Lexer
+from modules import Unit, header_name, imported_headers, load_modules, source_name
+from optimizer import PASSES, Optimizer
 from parser import Parser
+from pch import ensure_pch, included_modules, rebuild_all
+from runner import run_tests
+from server import SOCKET_PATH, serve
+from stdlib_index import load as load_index
+from watch import watch
 from codegen import CodeGenerator
 
 
-def compile(ctx):
-    lexer = Lexer(ctx)
-    tokens = lexer.scan_tokens()
+@dataclass
+class Phase:
+    time: float
+    count: int = None
+    unit: str = ""
 
-    parser = Parser(ctx, tokens)
-    statements = parser.parse()
 
-    interpreter = CodeGenerator(ctx)
-    return interpreter.compile(statements)
+def record(timings, name, start, count=None, unit=""):
+    # timings maps phase names to Phase, in the order the phases ran
+    if timings is not None:
+        elapsed = time.perf_counter() - start
+        if name in timings:
+            timings[name].time += elapsed
+        else:
+            timings[name] = Phase(elapsed, count, unit)
+
+
+# path -> (source, statements) of the files this process parsed, so a
+# resident compiler (watch, serve) only parses the files that changed
+_parsed = {}
+
+
+def parse(ctx, compact=False, frontend_cache=False, timings=None):
+    start = time.perf_counter()
+    path = os.path.abspath(ctx.file)
+    if frontend_cache and path in _parsed and _parsed[path][0] == ctx.src:
+        statements = _parsed[path][1]
+        record(timings, "frontend cache", start,
+               count_nodes(statements) if timings is not None else None, "nodes")
+        return statements
+
+    statements = load_statements(ctx) if frontend_cache else None
+    if statements is not None:
+        record(timings, "frontend cache", start,
+               count_nodes(statements) if timings is not None else None, "nodes")
+    elif frontend_cache:
+        record(timings, "frontend cache", start)
+
+    if statements is None:
+        start = time.perf_counter()
+        lexer = Lexer(ctx, compact)
+        tokens = lexer.scan_tokens()
+        record(timings, "lex", start, len(tokens), "tokens")
+
+        start = time.perf_counter()
+        parser = Parser(ctx, tokens)
+        statements = parser.parse()
+        record(timings, "parse", start,
+               count_nodes(statements) if timings is not None else None, "nodes")
+
+        if frontend_cache:
+            start = time.perf_counter()
+            store_statements(ctx, statements)
+            record(timings, "frontend cache", start)
+
+    if frontend_cache:
+        _parsed[path] = (ctx.src, statements)
+    return statements
+
+
+def compile(ctx, compact=False, out=None, include_all=False, frontend_cache=False, timings=None, passes=PASSES, intern_strings=True, infer=True, statements=None):
+    # C++ for a program without imports, one translation unit
+    if statements is None:
+        statements = parse(ctx, compact, frontend_cache, timings)
+
+    if passes:
+        start = time.perf_counter()
+        statements = Optimizer(passes, wide_ints=infer).optimize(statements)
+        record(timings, "optimize", start,
+               count_nodes(statements) if timings is not None else None, "nodes")
+
+    types = None
+    if infer:
+        start = time.perf_counter()
+        types = infer_types(statements, load_index(ctx.include_path))
+        record(timings, "infer", start, types.count(), "typed")
+
+    start = time.perf_counter()
+    interpreter = CodeGenerator(ctx, out, include_all, intern_strings, types)
+    code = interpreter.compile(statements)
+    record(timings, "codegen", start,
+           len(code) if out is None else out.tell(), "bytes")
+    return code
+
+
+def compile_modules(modules, include_all=False, timings=None, passes=PASSES, intern_strings=True, infer=True):
+    # C++ for the modules load_modules returned, a Unit per module. Types are
+    # inferred over all of them at once.
+    statements = [module.statements for module in modules]
+    if passes:
+        start = time.perf_counter()
+        optimizer = Optimizer(passes, wide_ints=infer)
+        statements = [optimizer.optimize(stmts) for stmts in statements]
+        record(timings, "optimize", start)
+
+    types = None
+    if infer:
+        start = time.perf_counter()
+        types = infer_modules([(module.name, stmts) for module, stmts in zip(modules, statements)],
+                              load_index(modules[-1].ctx.include_path))
+        record(timings, "infer", start, types.count(), "typed")
+
+    start = time.perf_counter()
+    functions = {module.name: module.functions() for module in modules}
+    units = []
+    for module, stmts in zip(modules, statements):
+        imports = [stmt.name.lexeme for stmt in module.imports()]
+        generator = CodeGenerator(module.ctx, None, include_all, intern_strings, types,
+                                  module.name, {name: functions[name] for name in imports})
+        if module.name is None:
+            header, source = None, generator.compile(stmts)
+        else:
+            header, source = generator.compile_module(stmts)
+        units.append(Unit(module.name, header, source, generator.included_mods(), imports))
+    record(timings, "codegen", start,
+           sum(len(unit.source) + len(unit.header or "") for unit in units), "bytes")
+    return units
+
+
+def build(include_path, out_path, code, build_path=None, flags=(), use_cache=True, use_pch=True, timings=None):
+    # C++ is piped to the compiler unless a build file is given, and each
+    # build gets its own TMPDIR so concurrent builds don't share scratch files
+    cxx = os.environ.get("CXX", "g++")
+    source = build_path if build_path is not None else "-"
+
+    if use_cache:
+        start = time.perf_counter()
+        cache = Cache("build")
+        key = build_key(code, include_path, cxx, flags)
+        hit = cache.restore(key, out_path)
+        record(timings, "build cache", start)
+        if hit:
+            return True
+
+    pch_flags = []
+    if use_pch:
+        start = time.perf_counter()
+        header = ensure_pch(include_path, cxx, flags, included_modules(code))
+        if header is not None:
+            pch_flags = ["-Winvalid-pch", "-include", header]
+        record(timings, "pch", start)
+
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="aiur-") as tmp:
+        proc = subprocess.run([cxx, "-I", include_path, *flags, *pch_flags, "-x", "c++", source, "-o", out_path],
+                              input=code if build_path is None else None,
+                              capture_output=True, text=True,
+                              env=dict(os.environ, TMPDIR=tmp))
+    record(timings, "g++", start)
+
+    sys.stderr.write(proc.stderr)
+    if proc.returncode != 0:
+        return False
+
+    if use_cache:
+        start = time.perf_counter()
+        cache.put(key, out_path)
+        record(timings, "build cache", start)
+    return True
+
+
+def build_modules(include_path, out_path, units, flags=(), jobs=None, use_cache=True, use_pch=True, timings=None):
+    # Compiles every unit to an object file of its own, running up to jobs
+    # g++ processes at once, and links them. An object is reused from the
+    # cache as long as its source and the headers it includes are unchanged.
+    cxx = os.environ.get("CXX", "g++")
+    cache = Cache("objects")
+
+    with tempfile.TemporaryDirectory(prefix="aiur-") as work:
+        for unit in units:
+            files = [(source_name(unit.name), unit.source)]
+            if unit.header is not None:
+                files.append((header_name(unit.name), unit.header))
+            for name, code in files:
+                path = os.path.join(work, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "w") as f:
+                    f.write(code)
+
+        start = time.perf_counter()
+        headers = {unit.name: unit.header for unit in units}
+        objects, pending = [], []
+        for unit in units:
+            obj = os.path.join(work, source_name(unit.name)[:-len(".cpp")] + ".o")
+            objects.append(obj)
+            included = [unit.source, *(headers[name] for name in imported_headers(units, unit))]
+            key = build_key("\0".join(included), include_path, cxx, ["-c", *flags])
+            if not (use_cache and cache.restore(key, obj)):
+                pending.append((unit, obj, key))
+        record(timings, "object cache", start, len(units) - len(pending), "reused")
+
+        pch_flags = {}
+        if use_pch:
+            start = time.perf_counter()
+            for unit, _, _ in pending:
+                mods = tuple(unit.mods)
+                if mods not in pch_flags:
+                    header = ensure_pch(include_path, cxx, flags, unit.mods)
+                    pch_flags[mods] = ["-Winvalid-pch", "-include", header] if header is not None else []
+            record(timings, "pch", start)
+
+        def compile_object(unit, obj):
+            with tempfile.TemporaryDirectory(prefix="aiur-") as tmp:
+                return subprocess.run([cxx, "-I", include_path, "-I", work, *flags, *pch_flags.get(tuple(unit.mods), []),
+                                       "-c", os.path.join(work, source_name(unit.name)), "-o", obj],
+                                      capture_output=True, text=True,
+                                      env=dict(os.environ, TMPDIR=tmp))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(jobs or os.cpu_count()) as pool:
+            futures = [pool.submit(compile_object, unit, obj) for unit, obj, _ in pending]
+            procs = [future.result() for future in futures]
+        record(timings, "g++", start, len(pending), "objects")
+
+        ok = True
+        for (_, obj, key), proc in zip(pending, procs):
+            sys.stderr.write(proc.stderr)
+            if proc.returncode != 0:
+                ok = False
+            elif use_cache:
+                cache.put(key, obj)
+        if not ok:
+            return False
+
+        start = time.perf_counter()
+        proc = subprocess.run([cxx, *flags, *objects, "-o", out_path], capture_output=True, text=True)
+        record(timings, "link", start, len(objects), "objects")
+        sys.stderr.write(proc.stderr)
+        return proc.returncode == 0
+
+
+def build_pgo(include_path, out_path, code, flags, training_args=(), timings=None):
+    # Builds an instrumented binary, runs it with the training arguments and
+    # rebuilds with the recorded profile. Profiles are cached per generated
+    # code, flags and training arguments, so only the last step repeats.
+    cxx = os.environ.get("CXX", "g++")
+    cache = Cache("pgo")
+    key = build_key(code, include_path, cxx, [*flags, "pgo", *training_args])
+
+    with tempfile.TemporaryDirectory(prefix="aiur-pgo-") as work:
+        # profile files are named after the output, so it must not change
+        exe = os.path.join(work, "prog")
+
+        data = cache.read(key)
+        if data is not None:
+            for name, profile in marshal.loads(data).items():
+                with open(os.path.join(work, os.path.basename(name)), "wb") as f:
+                    f.write(profile)
+        else:
+            if not build(include_path, exe, code, flags=[*flags, "-fprofile-generate"],
+                         use_cache=False, use_pch=False, timings=timings):
+                return False
+
+            start = time.perf_counter()
+            proc = subprocess.run([exe, *training_args])
+            record(timings, "pgo training run", start)
+            if proc.returncode != 0:
+                print(f"training run exited with status {proc.returncode}", file=sys.stderr)
+                return False
+
+            profiles = {}
+            for name in os.listdir(work):
+                if name.endswith(".gcda"):
+                    with open(os.path.join(work, name), "rb") as f:
+                        profiles[name] = f.read()
+            cache.write(key, marshal.dumps(profiles))
+
+        if not build(include_path, exe, code, flags=[*flags, "-fprofile-use", "-fprofile-correction", "-Wno-missing-profile"],
+                     use_cache=False, use_pch=False, timings=timings):
+            return False
+        copy_atomic(exe, out_path)
+    return True
+
+
+def optimization_flags(args):
+    flags = []
+    if args.release:
+        flags += ["-O2", "-DNDEBUG", "-flto"]
+    if args.opt_level is not None:
+        flags = [flag for flag in flags if not flag.startswith("-O")]
+        flags.append(f"-O{args.opt_level}")
+    elif args.pgo and not args.release:
+        flags.append("-O2")
+    if args.native:
+        flags.append("-march=native")
+    return flags
+
+
+def print_timings(timings):
+    total = sum(phase.time for phase in timings.values())
+    for name, phase in timings.items():
+        count = f"{phase.count} {phase.unit}" if phase.count is not None else ""
+        share = phase.time / total * 100 if total > 0 else 0
+        print(f"{name:16} {phase.time*1000:10.2f}ms {share:5.1f}%  {count}", file=sys.stderr)
+    print(f"{'total':16} {total*1000:10.2f}ms", file=sys.stderr)
+
+
+def stdlib_path():
+    return os.path.join(os.path.dirname(__file__), "..", "stdlib")
 
 
 def compile_file(args):
-    include_path = os.path.join(os.path.dirname(__file__), "..", "stdlib")
+    include_path = stdlib_path()
+
+    timings = {} if args.time_phases else None
+    profiler = cProfile.Profile() if args.profile else None
+    flags = optimization_flags(args)
+    if args.time_report:
+        flags.append("-ftime-report")
 
+    start = time.perf_counter()
     with open(args.path) as f:
         ctx = Context(args.path, f.read(), include_path)
-    out = compile(ctx)
+    record(timings, "read source", start, len(ctx.src), "bytes")
+
+    def profiled(function, *options):
+        if profiler is None:
+            return function(*options)
+        return profiler.runcall(function, *options)
+
+    passes = [name for name in PASSES if name not in args.disabled_passes]
+    modules = load_modules(ctx, lambda ctx: profiled(
+        parse, ctx, args.compact, args.frontend_cache, timings))
+    # a program with imports is compiled to an object file per module
+    separate = len(modules) > 1
+    if separate and (args.build_path is not None or args.pgo):
+        sys.exit("-b and --pgo only support programs without imports")
 
-    with open(args.build_path, "w+") as f:
-        f.write(out)
+    def front_end(out=None):
+        return profiled(compile, ctx, args.compact, out, args.include_all, args.frontend_cache,
+                        timings, passes, args.intern_strings, args.infer, modules[0].statements)
 
-    if os.system(f"g++ -I {include_path} -o {args.out_path} {args.build_path}"):
+    if separate:
+        units = profiled(compile_modules, modules, args.include_all, timings,
+                         passes, args.intern_strings, args.infer)
+    elif args.build_path is not None:
+        with open(args.build_path, "w+") as f:
+            # code generation writes the file as it goes, its time is in the
+            # codegen phase
+            front_end(f)
+            start = time.perf_counter()
+            f.seek(0)
+            code = f.read()
+        record(timings, "read build file", start, len(code), "bytes")
+    else:
+        code = front_end()
+
+    if profiler:
+        profiler.dump_stats(args.profile)
+
+    # a cache hit would skip the compiler and its report
+    use_cache = args.cache and not args.time_report
+    if separate:
+        ok = build_modules(include_path, args.out_path, units, flags, args.jobs,
+                           use_cache=use_cache, use_pch=args.pch, timings=timings)
+    elif args.pgo:
+        ok = build_pgo(include_path, args.out_path, code, flags,
+                       shlex.split(args.pgo_args), timings)
+    else:
+        ok = build(include_path, args.out_path, code, args.build_path, flags,
+                   use_cache=use_cache, use_pch=args.pch, timings=timings)
+    if timings is not None:
+        print_timings(timings)
+    if not ok:
         exit(1)
 
     if args.run:
-        os.system(args.out_path if args.out_path.startswith(
-            "/") else "./"+args.out_path)
-
-
-def run_tests(args):
-    aiur_path = os.path.join(os.path.dirname(__file__), "..")
-    for file in os.listdir(aiur_path+"/examples"):
-        proc = subprocess.Popen(f"{aiur_path}/aiur c -r {aiur_path}/examples/{file}",
-                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True)
-        proc.wait()
-        if proc.returncode == 0:
-            print(f"✅ {file} {b''.join(proc.communicate())[:100]}")
+        exit(subprocess.run([os.path.abspath(args.out_path)]).returncode)
+
+
+def manage_cache(args):
+    for name in CACHES:
+        cache = Cache(name)
+        if args.action == "clear":
+            cache.clear()
+            print(f"cleared {cache.path}")
         else:
-            print(b"\n".join(proc.communicate()).decode().strip())
-            print(f"❌ {file}")
-            exit(1)
+            entries, size = cache.stats()
+            print(f"{name}: {entries} entries, {size/MB:.1f} MB "
+                  f"(limit {cache.max_size/MB:.0f} MB) in {cache.path}")
 
 
-def main():
+def manage_pch(args):
+    cxx = os.environ.get("CXX", "g++")
+    headers, ok = rebuild_all(stdlib_path(), cxx)
+    for header in headers:
+        print(f"built {header}.gch")
+    if not ok:
+        exit(1)
+
+
+def add_compile_arguments(parser):
+    parser.add_argument(
+        "-r", dest="run", action="store_true", help="Run executable after compiling")
+    parser.add_argument(
+        "-b", dest="build_path", help="Write the generated C++ to this path and compile it from there (for debugging)")
+    parser.add_argument(
+        "-o", dest="out_path", default="output.exe", help="Specify the out path (default: output.exe)")
+    parser.add_argument(
+        "--compact", action="store_true", help="Store tokens in compact arrays to reduce memory use")
+    parser.add_argument(
+        "--no-cache", dest="cache", action="store_false", help="Don't reuse or store executables in the build cache")
+    parser.add_argument(
+        "--no-pch", dest="pch", action="store_false", help="Don't use the precompiled stdlib header")
+    parser.add_argument(
+        "--all-includes", dest="include_all", action="store_true", help="Include every stdlib module, not only the ones the program uses")
+    parser.add_argument(
+        "--no-frontend-cache", dest="frontend_cache", action="store_false", help="Always lex and parse the source instead of reusing a cached AST")
+    parser.add_argument(
+        "--time-phases", action="store_true", help="Print how long each compilation phase took")
+    parser.add_argument(
+        "--profile", metavar="FILE", help="Profile the front-end with cProfile and write the stats to FILE")
+    parser.add_argument(
+        "-ftime-report", dest="time_report", action="store_true", help="Pass -ftime-report to g++")
+    parser.add_argument(
+        "-O", dest="opt_level", choices=["0", "1", "2", "3"], help="Optimization level passed to g++ (-O0 to -O3)")
+    parser.add_argument(
+        "--release", action="store_true", help="Optimized build: -O2 -DNDEBUG with link-time optimization")
+    parser.add_argument(
+        "--native", action="store_true", help="Optimize for the host CPU (-march=native)")
+    parser.add_argument(
+        "--pgo", action="store_true", help="Profile-guided build: build instrumented, run with --pgo-args, rebuild with the profile")
+    parser.add_argument(
+        "--pgo-args", default="", help="Arguments for the PGO training run")
+    parser.add_argument(
+        "--no-fold", dest="disabled_passes", action="append_const", const="fold", default=[], help="Don't fold constant expressions")
+    parser.add_argument(
+        "--no-dead-code", dest="disabled_passes", action="append_const", const="dead-code", help="Keep unreachable statements and constant branches")
+    parser.add_argument(
+        "--no-strip-unused", dest="disabled_passes", action="append_const", const="unused-functions", help="Keep functions that main never reaches")
+    parser.add_argument(
+        "--no-intern-strings", dest="intern_strings", action="store_false", help="Construct string literals where they are used instead of once at startup")
+    parser.add_argument(
+        "--no-infer", dest="infer", action="store_false", help="Declare every function as a template and every variable as auto instead of inferring types")
+    parser.add_argument(
+        "-j", dest="jobs", type=int, default=os.cpu_count(), help="Number of g++ processes compiling modules at once (default: number of CPUs)")
+    parser.add_argument("path")
+
+
+def argument_parser():
     parser = argparse.ArgumentParser(
         prog="aiur", usage="%(prog)s <mode>", description="Aiur compiler")
     subparsers = parser.add_subparsers(dest="mode", required=True)
 
     compile_parser = subparsers.add_parser("compile", aliases=["c"])
-    compile_parser.add_argument(
-        "-r", dest="run", action="store_true", help="Run executable after compiling")
-    compile_parser.add_argument(
-        "-b", dest="build_path", default="/tmp/aiur_build.cpp", help="Specify the build path (default: /tmp/aiur_build.cpp)")
-    compile_parser.add_argument(
-        "-o", dest="out_path", default="output.exe", help="Specify the out path (default: output.exe)")
-    compile_parser.add_argument("path")
+    add_compile_arguments(compile_parser)
     compile_parser.set_defaults(func=compile_file)
 
-    test_parser = subparsers.add_parser("test")
+    watch_parser = subparsers.add_parser(
+        "watch", help="Keep the compiler running and compile a program again whenever a source file next to it changes")
+    add_compile_arguments(watch_parser)
+    watch_parser.add_argument(
+        "--poll", action="store_true", help="Poll the files for changes instead of using inotify")
+    watch_parser.set_defaults(func=watch)
+
+    serve_parser = subparsers.add_parser(
+        "serve", help="Keep the compiler running and take commands over a Unix socket, the aiur script sends them there when AIUR_SERVER is set to it")
+    serve_parser.add_argument(
+        "--socket", default=SOCKET_PATH, help=f"Path of the socket (default: {SOCKET_PATH})")
+    serve_parser.set_defaults(func=serve)
+
+    cache_parser = subparsers.add_parser(
+        "cache", help="Inspect or clear the build cache (AIUR_CACHE_DIR, bounded by AIUR_CACHE_SIZE megabytes)")
+    cache_parser.add_argument("action", choices=["stats", "clear"])
+    cache_parser.set_defaults(func=manage_cache)
+
+    pch_parser = subparsers.add_parser(
+        "pch", help="Manage the precompiled stdlib headers, rebuild builds them again for --all-includes and every module set in the pch cache")
+    pch_parser.add_argument("action", choices=["rebuild"])
+    pch_parser.set_defaults(func=manage_pch)
+
+    test_parser = subparsers.add_parser(
+        "test", help="Compile and run programs in parallel, checking them against <name>.out files when present")
+    test_parser.add_argument(
+        "-j", dest="jobs", type=int, default=os.cpu_count(), help="Number of tests to run at once (default: number of CPUs)")
+    test_parser.add_argument(
+        "--timeout", type=float, default=60, help="Seconds a test may run before it fails (default: 60)")
+    test_parser.add_argument(
+        "--junit", help="Write a JUnit XML report to this path")
+    test_parser.add_argument(
+        "--json", help="Write a JSON report to this path")
+    test_parser.add_argument("paths", nargs="*", default=[os.path.join(
+        os.path.dirname(__file__), "..", "examples")], help="Programs or directories of programs (default: examples/)")
     test_parser.set_defaults(func=run_tests)
 
-    args = parser.parse_args()
+    bench_parser = subparsers.add_parser(
+        "bench-compiler", help="Benchmark the compiler phases on examples/ and generated stress programs")
+    bench_parser.add_argument(
+        "-n", dest="repeat", type=int, default=5, help="Number of runs per program (default: 5)")
+    bench_parser.add_argument(
+        "--no-gxx", dest="gxx", action="store_false", help="Skip the g++ phase")
+    bench_parser.add_argument(
+        "--filter", help="Only benchmark programs whose name contains this string")
+    bench_parser.add_argument(
+        "--save", help="Write the results as JSON to this path")
+    bench_parser.add_argument(
+        "--baseline", help="Compare against results saved with --save and fail on regressions")
+    bench_parser.add_argument(
+        "--threshold", type=float, default=0.1, help="Slowdown of a phase's median that counts as a regression (default: 0.1)")
+    bench_parser.set_defaults(func=bench_compiler)
+
+    return parser
+
+
+def main():
+    args = argument_parser().parse_args()
     args.func(args)
 
 
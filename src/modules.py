@@ -0,0 +1,115 @@
+import os
+from dataclasses import dataclass
+from typing import List, Optional
+
+import ctx
+import stdlib_index
+from ctx import Context
+from expr import FunctionStmt, ImportStmt
+
+SOURCE_EXT = ".aiur"
+
+# names generated code already uses at the top level
+RESERVED_NAMESPACES = {"std", "_literals"}
+
+
+@dataclass
+class Module:
+    # namespace of the module, None for the program
+    name: Optional[str]
+    ctx: Context
+    statements: list
+
+    def imports(self):
+        return [stmt for stmt in self.statements if isinstance(stmt, ImportStmt)]
+
+    def functions(self):
+        return [stmt.name.lexeme for stmt in self.statements if isinstance(stmt, FunctionStmt)]
+
+
+@dataclass
+class Unit:
+    # the generated C++ of a module, compiled to an object file of its own
+    name: Optional[str]
+    # None for the program, nothing includes it
+    header: Optional[str]
+    source: str
+    # stdlib modules it includes
+    mods: List[str]
+    # namespaces of the modules it imports
+    imports: List[str]
+
+
+def header_name(namespace):
+    return namespace.replace("::", "/") + ".h"
+
+
+def source_name(namespace):
+    # module names can't start with an underscore, the program's can't clash
+    return namespace.replace("::", "/") + ".cpp" if namespace is not None else "_program.cpp"
+
+
+def module_path(program, name):
+    # `shapes::circle` is shapes/circle.aiur in the program's directory
+    return os.path.join(os.path.dirname(program), *name.split("::")) + SOURCE_EXT
+
+
+def stdlib_namespaces(include_path):
+    namespaces = set(RESERVED_NAMESPACES)
+    for mod in stdlib_index.load(include_path).values():
+        namespaces.update(symbol.split("::")[0] for symbol in mod.symbols if "::" in symbol)
+    return namespaces
+
+
+def load_modules(program, parse):
+    # The program and every module it imports, transitively. A module comes
+    # after the modules it imports and the program comes last. parse(ctx)
+    # returns the statements of a file.
+    reserved = stdlib_namespaces(program.include_path)
+    loaded = {}
+    order = []
+
+    def visit(module, chain):
+        for stmt in module.imports():
+            name = stmt.name.lexeme
+            if name in chain:
+                cycle = " -> ".join([*chain[chain.index(name):], name])
+                ctx.error(f"import cycle: {cycle}", module.ctx, stmt.name.pos)
+            if name in loaded:
+                continue
+            # a nested namespace would hide the stdlib one from its parent too
+            clash = reserved.intersection(name.split("::"))
+            if clash:
+                ctx.error(f"module {name} would clash with the stdlib namespace {min(clash)}",
+                          module.ctx, stmt.name.pos)
+
+            path = module_path(program.file, name)
+            try:
+                with open(path) as f:
+                    src = f.read()
+            except OSError:
+                ctx.error(f"can't find module {name} at {path}", module.ctx, stmt.name.pos)
+
+            imported = Context(path, src, program.include_path)
+            loaded[name] = Module(name, imported, parse(imported))
+            visit(loaded[name], [*chain, name])
+            order.append(loaded[name])
+
+    root = Module(None, program, parse(program))
+    visit(root, [])
+    return [*order, root]
+
+
+def imported_headers(units, unit):
+    # names of the modules whose headers unit's source includes, transitively
+    imports = {u.name: u.imports for u in units}
+    seen = set()
+    stack = list(unit.imports)
+    if unit.name is not None:
+        stack.append(unit.name)
+    while stack:
+        name = stack.pop()
+        if name not in seen:
+            seen.add(name)
+            stack.extend(imports[name])
+    return sorted(seen)
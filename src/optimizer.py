@@ -0,0 +1,257 @@
+import re
+from dataclasses import fields
+
+from expr import AssignExpr, BinaryExpr, BlockStmt, CallExpr, DeferStmt, Expr, ExpressionStmt, ForStmt, FunctionStmt, GroupingExpr, IfStmt, LiteralExpr, ReturnStmt, Stmt, UnaryExpr, VarStmt, VariableExpr, WhileStmt
+from lexer import TokenType
+
+PASSES = ("fold", "dead-code", "unused-functions")
+
+INT_RANGE = (-2**31, 2**31 - 1)
+LONG_RANGE = (-2**63, 2**63 - 1)
+
+# a string ending in one of these escapes would change meaning if more
+# characters were appended to it
+OPEN_ESCAPE_RE = re.compile(r"\\(x[0-9a-fA-F]*|[0-7]{1,2}|u[0-9a-fA-F]{0,3}|U[0-9a-fA-F]{0,7})$")
+
+
+def int_range(value, wide=False):
+    # the C++ type an integer literal gets: int if it fits, long otherwise.
+    # Wide literals are emitted as int64_t whatever their value.
+    if wide:
+        return LONG_RANGE
+    return INT_RANGE if INT_RANGE[0] <= value <= INT_RANGE[1] else LONG_RANGE
+
+
+def is_int(value):
+    return type(value) is int
+
+
+def fold_int(typ, left, right, wide=False):
+    if int_range(left, wide) == LONG_RANGE or int_range(right, wide) == LONG_RANGE:
+        low, high = LONG_RANGE
+    else:
+        low, high = INT_RANGE
+
+    if typ == TokenType.PLUS:
+        value = left + right
+    elif typ == TokenType.MINUS:
+        value = left - right
+    elif typ == TokenType.STAR:
+        value = left * right
+    elif typ in (TokenType.SLASH, TokenType.MOD):
+        if right == 0:
+            return None
+        # C++ division truncates towards zero
+        quotient = abs(left) // abs(right)
+        if (left < 0) != (right < 0):
+            quotient = -quotient
+        value = quotient if typ == TokenType.SLASH else left - right * quotient
+    elif typ == TokenType.GT:
+        return left > right
+    elif typ == TokenType.GE:
+        return left >= right
+    elif typ == TokenType.LT:
+        return left < right
+    elif typ == TokenType.LE:
+        return left <= right
+    elif typ == TokenType.EQ:
+        return left == right
+    elif typ == TokenType.NEQ:
+        return left != right
+    else:
+        return None
+
+    # leave anything that would overflow in C++ alone
+    return value if low <= value <= high else None
+
+
+def fold_binary(typ, left, right, wide=False):
+    if is_int(left) and is_int(right):
+        return fold_int(typ, left, right, wide)
+
+    if type(left) is bool and type(right) is bool:
+        if typ == TokenType.EQ:
+            return left == right
+        elif typ == TokenType.NEQ:
+            return left != right
+        return None
+
+    if type(left) is str and type(right) is str:
+        if typ == TokenType.PLUS and not OPEN_ESCAPE_RE.search(left):
+            return left + right
+        # escapes make textual and runtime equality differ
+        if "\\" in left or "\\" in right:
+            return None
+        if typ == TokenType.EQ:
+            return left == right
+        elif typ == TokenType.NEQ:
+            return left != right
+
+    return None
+
+
+def fold_unary(typ, value, wide=False):
+    if typ == TokenType.BANG and type(value) in (bool, int):
+        return not value
+    if typ == TokenType.MINUS and is_int(value):
+        low, high = int_range(value, wide)
+        return -value if low <= -value <= high else None
+    return None
+
+
+def is_constant(expr):
+    return isinstance(expr, LiteralExpr) and type(expr.value) in (bool, int)
+
+
+def referenced_names(node):
+    names = set()
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, (VariableExpr, AssignExpr)):
+            names.add(node.name.lexeme)
+            stack.extend(getattr(node, field.name) for field in fields(node))
+        elif isinstance(node, (Expr, Stmt)):
+            stack.extend(getattr(node, field.name) for field in fields(node))
+    return names
+
+
+class Optimizer:
+    def __init__(self, passes=PASSES, wide_ints=False):
+        self.fold = "fold" in passes
+        # integer literals are int64_t, as codegen emits them with types
+        self.wide_ints = wide_ints
+        self.dead_code = "dead-code" in passes
+        self.unused_functions = "unused-functions" in passes
+
+    def optimize(self, statements):
+        statements = [stmt for stmt in (stmt.accept(self) for stmt in statements)
+                      if stmt is not None]
+        if self.unused_functions:
+            statements = self.strip_unused(statements)
+        return statements
+
+    def strip_unused(self, statements):
+        functions = {stmt.name.lexeme: stmt for stmt in statements
+                     if isinstance(stmt, FunctionStmt)}
+        if "main" not in functions:
+            return statements
+
+        stack = ["main"]
+        for stmt in statements:
+            if not isinstance(stmt, FunctionStmt):
+                stack.extend(referenced_names(stmt))
+
+        reachable = set()
+        while stack:
+            name = stack.pop()
+            if name in reachable or name not in functions:
+                continue
+            reachable.add(name)
+            stack.extend(referenced_names(functions[name].body))
+
+        return [stmt for stmt in statements
+                if not isinstance(stmt, FunctionStmt) or stmt.name.lexeme in reachable]
+
+    def optimize_block(self, statements):
+        out = []
+        for stmt in statements:
+            stmt = stmt.accept(self)
+            if stmt is None:
+                continue
+            out.append(stmt)
+            if self.dead_code and isinstance(stmt, ReturnStmt):
+                break
+        return out
+
+    def optimize_branch(self, stmt):
+        # a branch must stay a statement even if everything in it was removed
+        stmt = stmt.accept(self)
+        return stmt if stmt is not None else BlockStmt([])
+
+    def visit_expression_stmt(self, stmt):
+        return ExpressionStmt(stmt.expr.accept(self))
+
+    def visit_if_stmt(self, stmt):
+        condition = stmt.condition.accept(self)
+
+        if self.dead_code and is_constant(condition):
+            if condition.value:
+                return stmt.then_branch.accept(self)
+            elif stmt.else_branch is not None:
+                return stmt.else_branch.accept(self)
+            return None
+
+        else_branch = self.optimize_branch(
+            stmt.else_branch) if stmt.else_branch is not None else None
+        return IfStmt(condition, self.optimize_branch(stmt.then_branch), else_branch)
+
+    def visit_while_stmt(self, stmt):
+        condition = stmt.condition.accept(self)
+
+        if self.dead_code and is_constant(condition) and not condition.value:
+            return None
+
+        return WhileStmt(condition, self.optimize_branch(stmt.body))
+
+    def visit_for_stmt(self, stmt):
+        return ForStmt(stmt.variable, stmt.iterator.accept(self), self.optimize_branch(stmt.body),
+                       stmt.parallel, stmt.reductions)
+
+    def visit_function_stmt(self, stmt):
+        return FunctionStmt(stmt.name, stmt.params, BlockStmt(self.optimize_block(stmt.body.statements)))
+
+    def visit_return_stmt(self, stmt):
+        value = stmt.value.accept(self) if stmt.value is not None else None
+        return ReturnStmt(stmt.keyword, value)
+
+    def visit_var_stmt(self, stmt):
+        initializer = stmt.initializer.accept(
+            self) if stmt.initializer is not None else None
+        return VarStmt(stmt.name, initializer)
+
+    def visit_block_stmt(self, stmt):
+        return BlockStmt(self.optimize_block(stmt.statements))
+
+    def visit_defer_stmt(self, stmt):
+        return DeferStmt(stmt.block.accept(self))
+
+    def visit_import_stmt(self, stmt):
+        return stmt
+
+    def visit_literal(self, expr):
+        return expr
+
+    def visit_grouping(self, expr):
+        inner = expr.expr.accept(self)
+        if self.fold and isinstance(inner, LiteralExpr):
+            return inner
+        return GroupingExpr(inner)
+
+    def visit_variable(self, expr):
+        return expr
+
+    def visit_assign(self, expr):
+        return AssignExpr(expr.name, expr.value.accept(self))
+
+    def visit_unary(self, expr):
+        right = expr.right.accept(self)
+        if self.fold and isinstance(right, LiteralExpr):
+            value = fold_unary(expr.op.typ, right.value, self.wide_ints)
+            if value is not None:
+                return LiteralExpr(value)
+        return UnaryExpr(expr.op, right)
+
+    def visit_call(self, expr):
+        return CallExpr(expr.callee, expr.paren, [arg.accept(self) for arg in expr.arguments])
+
+    def visit_binary(self, expr):
+        left = expr.left.accept(self)
+        right = expr.right.accept(self)
+        if self.fold and isinstance(left, LiteralExpr) and isinstance(right, LiteralExpr):
+            value = fold_binary(expr.op.typ, left.value, right.value, self.wide_ints)
+            if value is not None:
+                return LiteralExpr(value)
+        return BinaryExpr(left, expr.op, right)
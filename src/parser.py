@@ -1,7 +1,51 @@
+from types import GeneratorType
+
 import ctx
-from expr import AssignExpr, BinaryExpr, BlockStmt, CallExpr, DeferStmt, ExpressionStmt, ForStmt, FunctionStmt, GroupingExpr, IfStmt, LiteralExpr, ReturnStmt, UnaryExpr, VarStmt, VariableExpr, WhileStmt
+from expr import AssignExpr, BinaryExpr, BlockStmt, CallExpr, DeferStmt, ExpressionStmt, ForStmt, FunctionStmt, GroupingExpr, IfStmt, ImportStmt, LiteralExpr, Reduction, ReturnStmt, UnaryExpr, VarStmt, VariableExpr, WhileStmt
 from lexer import TokenType
 
+ASSIGN_PRECEDENCE = 0
+UNARY_PRECEDENCE = 5
+
+BINARY_PRECEDENCE = {
+    TokenType.EQ: 1,
+    TokenType.NEQ: 1,
+    TokenType.GT: 2,
+    TokenType.GE: 2,
+    TokenType.LT: 2,
+    TokenType.LE: 2,
+    TokenType.PLUS: 3,
+    TokenType.MINUS: 3,
+    TokenType.MOD: 4,
+    TokenType.STAR: 4,
+    TokenType.SLASH: 4,
+}
+
+UNARY_OPERATORS = {TokenType.BANG, TokenType.MINUS}
+
+REDUCTIONS = {"sum", "min", "max"}
+
+LITERALS = {
+    TokenType.NUMBER,
+    TokenType.STRING,
+    TokenType.TRUE,
+    TokenType.FALSE,
+}
+
+# what a compound statement asks the driver in Parser.declaration to parse next
+DECLARATION = 0
+STATEMENT = 1
+
+
+class ExprFrame:
+    __slots__ = ("callee", "arguments", "ops", "operands")
+
+    def __init__(self, callee=None):
+        self.callee = callee
+        self.arguments = []
+        self.ops = []
+        self.operands = []
+
 
 class Parser:
     def __init__(self, ctx, tokens):
@@ -13,18 +57,49 @@ class Parser:
         statements = []
 
         while not self.eof():
-            statements.append(self.declaration())
+            # imports are only allowed at the top level
+            if self.match(TokenType.IMPORT):
+                statements.append(self.import_statement())
+            else:
+                statements.append(self.declaration())
 
         return statements
 
     def declaration(self):
-        if self.match(TokenType.VAR):
-            return self.var_declaration()
-        else:
-            return self.statement()
+        return self.run(DECLARATION)
 
     def statement(self):
-        if self.match(TokenType.IF):
+        return self.run(STATEMENT)
+
+    def run(self, kind):
+        # Compound statements are generators that yield the kind of child
+        # statement they need and receive the parsed node back, so nesting
+        # depth is bounded by this stack and not by Python's call stack.
+        stack = []
+        result = self.begin_statement(kind)
+
+        while True:
+            if isinstance(result, GeneratorType):
+                stack.append(result)
+                value = None
+            elif not stack:
+                return result
+            else:
+                value = result
+
+            try:
+                kind = stack[-1].send(value)
+            except StopIteration as stop:
+                stack.pop()
+                result = stop.value
+                continue
+
+            result = self.begin_statement(kind)
+
+    def begin_statement(self, kind):
+        if kind == DECLARATION and self.match(TokenType.VAR):
+            return self.var_declaration()
+        elif self.match(TokenType.IF):
             return self.if_statement()
         elif self.match(TokenType.WHILE):
             return self.while_statement()
@@ -44,24 +119,50 @@ class Parser:
     def if_statement(self):
         condition = self.expression()
 
-        then_branch = self.statement()
-        else_branch = self.statement() if self.match(TokenType.ELSE) else None
+        then_branch = yield STATEMENT
+        else_branch = (yield STATEMENT) if self.match(TokenType.ELSE) else None
 
         return IfStmt(condition, then_branch, else_branch)
 
     def while_statement(self):
         condition = self.expression()
-        body = self.statement()
+        body = yield STATEMENT
         return WhileStmt(condition, body)
 
     def for_statement(self):
+        parallel = self.match(TokenType.PAR)
         variable = self.consume()
         if not self.match(TokenType.IN):
             ctx.error(
                 f"expected IN, got {self.peek().typ}", self.ctx, self.peek().pos)
         iterator = self.expression()
-        body = self.statement()
-        return ForStmt(variable, iterator, body)
+
+        reductions = []
+        if parallel and self.match(TokenType.REDUCE):
+            reductions.append(self.reduction())
+            while self.match(TokenType.COMMA):
+                reductions.append(self.reduction())
+
+        body = yield STATEMENT
+        return ForStmt(variable, iterator, body, parallel, reductions)
+
+    def reduction(self):
+        # `sum total` in `for par i in ... reduce sum total, max best`
+        if not self.check(TokenType.IDENTIFIER) or self.peek().lexeme not in REDUCTIONS:
+            ctx.error(
+                f"expected sum, min or max, got {self.peek().lexeme}", self.ctx, self.peek().pos)
+        op = self.consume()
+        if not self.match(TokenType.IDENTIFIER):
+            ctx.error(
+                f"expected variable name, got {self.peek().typ}", self.ctx, self.peek().pos)
+        return Reduction(op, self.previous())
+
+    def import_statement(self):
+        keyword = self.previous()
+        if not self.match(TokenType.IDENTIFIER):
+            ctx.error(
+                f"expected module name, got {self.peek().typ}", self.ctx, self.peek().pos)
+        return ImportStmt(keyword, self.previous())
 
     def function_statement(self):
         if not self.match(TokenType.IDENTIFIER):
@@ -87,14 +188,14 @@ class Parser:
             ctx.error(f"expected {{, got {self.peek().typ}",
                       self.ctx, self.peek().pos)
 
-        body = self.block_statement()
+        body = yield from self.block_statement()
         return FunctionStmt(name, parameters, body)
 
     def block_statement(self):
         statements = []
 
         while not self.check(TokenType.RBRACE) and not self.eof():
-            statements.append(self.declaration())
+            statements.append((yield DECLARATION))
 
         if not self.match(TokenType.RBRACE):
             ctx.error(
@@ -113,7 +214,8 @@ class Parser:
             ctx.error(f"expected {{, got {self.peek().typ}",
                       self.ctx, self.peek().pos)
 
-        return DeferStmt(self.block_statement())
+        block = yield from self.block_statement()
+        return DeferStmt(block)
 
     def expression_statement(self):
         expr = self.expression()
@@ -132,121 +234,105 @@ class Parser:
         return VarStmt(name, initializer)
 
     def expression(self):
-        return self.assignment()
-
-    def assignment(self):
-        expr = self.equality()
-
-        if self.match(TokenType.ASSIGN):
-            value = self.assignment()
-
-            if isinstance(expr, VariableExpr):
-                return AssignExpr(expr.name, value)
-            else:
-                ctx.error("invalid assignment target",
-                          self.ctx, self.peek().pos)
-
-        return expr
-
-    def equality(self):
-        expr = self.comparison()
-
-        while self.match(TokenType.NEQ, TokenType.EQ):
-            op = self.previous()
-            right = self.comparison()
-            expr = BinaryExpr(expr, op, right)
-
-        return expr
-
-    def comparison(self):
-        expr = self.term()
-
-        while self.match(TokenType.GT, TokenType.GE, TokenType.LT, TokenType.LE):
-            op = self.previous()
-            right = self.term()
-            expr = BinaryExpr(expr, op, right)
-
-        return expr
-
-    def term(self):
-        expr = self.factor()
-
-        while self.match(TokenType.PLUS, TokenType.MINUS):
-            op = self.previous()
-            right = self.factor()
-            expr = BinaryExpr(expr, op, right)
-
-        return expr
-
-    def factor(self):
-        expr = self.unary()
-
-        while self.match(TokenType.MOD, TokenType.STAR, TokenType.SLASH):
-            op = self.previous()
-            right = self.unary()
-            expr = BinaryExpr(expr, op, right)
-
-        return expr
-
-    def unary(self):
-        if self.match(TokenType.BANG, TokenType.MINUS):
-            op = self.previous()
-            right = self.unary()
-            return UnaryExpr(op, right)
-
-        return self.call()
-
-    def call(self):
-        expr = self.primary()
+        # Precedence climbing over explicit operator/operand stacks. Groupings
+        # and call argument lists open a new frame instead of recursing.
+        tokens = self.tokens
+        frames = [ExprFrame()]
+        frame = frames[0]
+        expect_operand = True
 
         while True:
-            if self.match(TokenType.LPAREN):
-                expr = self.finish_call(expr)
+            token = tokens[self.current]
+            typ = token.typ
+
+            if expect_operand:
+                if typ in UNARY_OPERATORS:
+                    frame.ops.append((UNARY_PRECEDENCE, token))
+                elif typ == TokenType.IDENTIFIER:
+                    frame.operands.append(VariableExpr(token))
+                    expect_operand = False
+                elif typ in LITERALS:
+                    frame.operands.append(self.literal(token))
+                    expect_operand = False
+                elif typ == TokenType.LPAREN:
+                    frame = ExprFrame()
+                    frames.append(frame)
+                else:
+                    ctx.error(f"unexpected {typ}", self.ctx, token.pos)
+                self.current += 1
+                continue
+
+            precedence = BINARY_PRECEDENCE.get(typ)
+            if precedence is not None:
+                self.reduce(frame, precedence)
+                frame.ops.append((precedence, token))
+                expect_operand = True
+            elif typ == TokenType.ASSIGN:
+                self.reduce(frame, ASSIGN_PRECEDENCE + 1)
+                frame.ops.append((ASSIGN_PRECEDENCE, token))
+                expect_operand = True
+            elif typ == TokenType.LPAREN:
+                frame = ExprFrame(frame.operands.pop())
+                frames.append(frame)
+                if tokens[self.current+1].typ == TokenType.RPAREN:
+                    self.current += 1
+                    frames.pop()
+                    call = CallExpr(frame.callee, tokens[self.current], [])
+                    frame = frames[-1]
+                    frame.operands.append(call)
+                else:
+                    expect_operand = True
+            elif len(frames) == 1:
+                self.reduce(frame, ASSIGN_PRECEDENCE)
+                return frame.operands[0]
+            elif typ == TokenType.COMMA and frame.callee is not None:
+                self.reduce(frame, ASSIGN_PRECEDENCE)
+                frame.arguments.append(frame.operands.pop())
+                expect_operand = True
+            elif typ == TokenType.RPAREN:
+                self.reduce(frame, ASSIGN_PRECEDENCE)
+                frames.pop()
+                if frame.callee is None:
+                    expr = GroupingExpr(frame.operands[0])
+                else:
+                    frame.arguments.append(frame.operands.pop())
+                    expr = CallExpr(frame.callee, token, frame.arguments)
+                frame = frames[-1]
+                frame.operands.append(expr)
             else:
-                break
-
-        return expr
-
-    def finish_call(self, callee):
-        arguments = []
-        if not self.check(TokenType.RPAREN):
-            arguments.append(self.expression())
-            while self.match(TokenType.COMMA):
-                arguments.append(self.expression())
-
-        if not self.match(TokenType.RPAREN):
-            ctx.error(f"expected ), got {self.peek().typ}",
-                      self.ctx, self.peek().pos)
-        paren = self.previous()
+                ctx.error(f"expected ), got {typ}", self.ctx, token.pos)
+            self.current += 1
 
-        return CallExpr(callee, paren, arguments)
+    def reduce(self, frame, min_precedence):
+        ops = frame.ops
+        operands = frame.operands
+
+        while ops and ops[-1][0] >= min_precedence:
+            precedence, op = ops.pop()
+            right = operands.pop()
+
+            if precedence == UNARY_PRECEDENCE:
+                operands.append(UnaryExpr(op, right))
+            elif precedence == ASSIGN_PRECEDENCE:
+                target = operands.pop()
+                if not isinstance(target, VariableExpr):
+                    ctx.error("invalid assignment target",
+                              self.ctx, self.peek().pos)
+                operands.append(AssignExpr(target.name, right))
+            else:
+                operands.append(BinaryExpr(operands.pop(), op, right))
 
-    def primary(self):
-        if self.match(TokenType.TRUE):
+    def literal(self, token):
+        if token.typ == TokenType.TRUE:
             return LiteralExpr(True)
-        elif self.match(TokenType.FALSE):
+        elif token.typ == TokenType.FALSE:
             return LiteralExpr(False)
-        elif self.match(TokenType.NUMBER, TokenType.STRING):
-            return LiteralExpr(self.previous().literal)
-        elif self.match(TokenType.LPAREN):
-            expr = self.expression()
-
-            if self.consume().typ != TokenType.RPAREN:
-                ctx.error(
-                    f"expected ), got {self.peek().typ}", self.ctx, self.peek().pos)
-
-            return GroupingExpr(expr)
-        elif self.match(TokenType.IDENTIFIER):
-            return VariableExpr(self.previous())
-        else:
-            ctx.error(f"unexpected {self.peek().typ}",
-                      self.ctx, self.peek().pos)
+        return LiteralExpr(token.literal)
 
-    def match(self, *types):
-        for typ in types:
-            if self.check(typ):
-                self.consume()
-                return True
+    def match(self, typ):
+        if self.check(typ):
+            self.consume()
+            return True
 
         return False
 
@@ -0,0 +1,131 @@
+import contextlib
+import hashlib
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+
+import stdlib_index
+from cache import Cache, compiler_version
+
+# the prelude records the flags it was compiled with after its includes
+FLAGS_PREFIX = "// flags: "
+
+
+def included_modules(code):
+    # the stdlib includes CodeGenerator emits at the top of the output
+    mods = []
+    start = 0
+    while code.startswith("#include \"", start):
+        end = code.index("\n", start)
+        mods.append(code[start+len("#include \""):end-1])
+        start = end + 1
+    return mods
+
+
+def pch_key(include_path, cxx, flags, mods):
+    h = hashlib.sha256()
+    h.update("\0".join(mods).encode() + b"\0")
+    for mod in sorted(os.listdir(include_path)):
+        path = os.path.join(include_path, mod)
+        st = os.stat(path)
+        h.update(f"{mod}\0{st.st_mtime_ns}\0".encode())
+        with open(path, "rb") as f:
+            h.update(f.read() + b"\0")
+    h.update(compiler_version(cxx).encode() + b"\0")
+    h.update("\0".join(flags).encode())
+    return h.hexdigest()
+
+
+def prelude(mods, flags=()):
+    return "".join("#include \"%s\"\n" % mod for mod in mods) + FLAGS_PREFIX + shlex.join(flags) + "\n"
+
+
+def all_modules(include_path):
+    # every stdlib module, in the order CodeGenerator includes them
+    return list(stdlib_index.load(include_path))
+
+
+def ensure_pch(include_path, cxx, flags=(), mods=None, rebuild=False):
+    # The prelude header and its .gch live side by side in the pch cache,
+    # so `-include <prelude>` makes the compiler pick up the .gch. There is
+    # one prelude per set of included modules. Without mods, the prelude
+    # of --all-includes builds.
+    if mods is None:
+        mods = all_modules(include_path)
+    cache = Cache("pch")
+    key = pch_key(include_path, cxx, flags, mods)
+    header = cache.entry(key + ".h")
+
+    if not rebuild and os.path.exists(header) and cache.get(key + ".h.gch"):
+        return header
+
+    os.makedirs(cache.path, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=cache.path, prefix=".aiur-")
+    with os.fdopen(fd, "w") as f:
+        f.write(prelude(mods, flags))
+    os.replace(tmp, header)
+
+    fd, tmp = tempfile.mkstemp(dir=cache.path, prefix=".aiur-")
+    os.close(fd)
+    proc = subprocess.run([cxx, "-I", include_path, *flags, "-x", "c++-header", header, "-o", tmp],
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        os.unlink(tmp)
+        sys.stderr.write(proc.stderr)
+        return None
+
+    os.replace(tmp, header + ".gch")
+    cache.evict()
+    return header
+
+
+def cached_preludes(cache):
+    # (key, mods, flags) of every prelude in the pch cache
+    try:
+        names = os.listdir(cache.path)
+    except FileNotFoundError:
+        return
+    for name in sorted(names):
+        if name.startswith(".") or not name.endswith(".h"):
+            continue
+        try:
+            with open(cache.entry(name)) as f:
+                text = f.read()
+        except FileNotFoundError:
+            continue
+        flags = []
+        for line in text.splitlines():
+            if line.startswith(FLAGS_PREFIX):
+                flags = shlex.split(line[len(FLAGS_PREFIX):])
+        yield name[:-len(".h")], included_modules(text), flags
+
+
+def rebuild_all(include_path, cxx):
+    # Builds the precompiled headers builds use again: the --all-includes
+    # prelude and every prelude in the pch cache, against the current
+    # stdlib and compiler. Entries whose key changed are replaced. Returns
+    # the headers that were built and whether all of them succeeded.
+    cache = Cache("pch")
+    modules = all_modules(include_path)
+    preludes = {}
+    for key, mods, flags in cached_preludes(cache):
+        # a prelude of a module that was removed is left to eviction
+        if all(mod in modules for mod in mods):
+            preludes.setdefault((tuple(mods), tuple(flags)), key)
+    preludes.setdefault((tuple(modules), ()), None)
+
+    headers = []
+    ok = True
+    for (mods, flags), old_key in preludes.items():
+        header = ensure_pch(include_path, cxx, list(flags), list(mods), rebuild=True)
+        if header is None:
+            ok = False
+            continue
+        headers.append(header)
+        if old_key is not None and cache.entry(old_key + ".h") != header:
+            for name in (old_key + ".h", old_key + ".h.gch"):
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(cache.entry(name))
+    return headers, ok
@@ -0,0 +1,143 @@
+import contextlib
+import io
+import json
+import os
+import subprocess
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+
+from ctx import Context
+
+# expected stdout of a test lives next to it, e.g. examples/fizzbuzz.out
+EXPECTED_EXT = ".out"
+
+
+@dataclass
+class TestResult:
+    name: str
+    # "passed", "failed" (ran but misbehaved), "timeout" or "error" (didn't compile)
+    status: str
+    compile_time: float
+    run_time: float
+    output: str
+    message: str
+
+
+def run_test(path, timeout):
+    # imported here so worker processes don't need main to be __main__
+    import main
+
+    name = os.path.basename(path)
+    log = io.StringIO()
+
+    with tempfile.TemporaryDirectory(prefix="aiur-test-") as tmp:
+        out_path = os.path.join(tmp, "test.exe")
+
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+                with open(path) as f:
+                    ctx = Context(path, f.read(), main.stdlib_path())
+                modules = main.load_modules(ctx, lambda ctx: main.parse(ctx, frontend_cache=True))
+                if len(modules) > 1:
+                    units = main.compile_modules(modules)
+                    ok = main.build_modules(ctx.include_path, out_path, units)
+                else:
+                    code = main.compile(ctx, statements=modules[0].statements)
+                    ok = main.build(ctx.include_path, out_path, code)
+        except SystemExit:
+            ok = False
+        compile_time = time.perf_counter() - start
+
+        if not ok:
+            return TestResult(name, "error", compile_time, 0, "", log.getvalue())
+
+        start = time.perf_counter()
+        try:
+            proc = subprocess.run([out_path], cwd=tmp, capture_output=True,
+                                  text=True, errors="replace", timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return TestResult(name, "timeout", compile_time, timeout, "",
+                              f"timed out after {timeout}s")
+        run_time = time.perf_counter() - start
+
+    if proc.returncode != 0:
+        return TestResult(name, "failed", compile_time, run_time, proc.stdout,
+                          f"exited with status {proc.returncode}\n{proc.stderr}")
+
+    expected_path = os.path.splitext(path)[0] + EXPECTED_EXT
+    if os.path.exists(expected_path):
+        with open(expected_path) as f:
+            expected = f.read()
+        if proc.stdout != expected:
+            return TestResult(name, "failed", compile_time, run_time, proc.stdout,
+                              f"output differs from {expected_path}")
+
+    return TestResult(name, "passed", compile_time, run_time, proc.stdout, "")
+
+
+def collect(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, file) for file in sorted(os.listdir(path))
+                         if file.endswith(".aiur"))
+        else:
+            files.append(path)
+    return files
+
+
+def write_junit(results, path, elapsed):
+    suite = ET.Element("testsuite", name="aiur", tests=str(len(results)),
+                       failures=str(sum(r.status in ("failed", "timeout")
+                                        for r in results)),
+                       errors=str(sum(r.status == "error" for r in results)),
+                       time=f"{elapsed:.3f}")
+    for result in results:
+        case = ET.SubElement(suite, "testcase", name=result.name, classname="aiur",
+                             time=f"{result.compile_time + result.run_time:.3f}")
+        if result.status != "passed":
+            tag = "error" if result.status == "error" else "failure"
+            ET.SubElement(case, tag, message=result.message.split("\n")[0]).text = result.message
+        ET.SubElement(case, "system-out").text = result.output
+    ET.ElementTree(suite).write(path, encoding="unicode", xml_declaration=True)
+
+
+def write_json(results, path, elapsed):
+    with open(path, "w") as f:
+        json.dump({"time": elapsed, "results": [asdict(r) for r in results]}, f, indent=2)
+
+
+def run_tests(args):
+    files = collect(args.paths)
+    results = []
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(args.jobs) as pool:
+        futures = [pool.submit(run_test, file, args.timeout) for file in files]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+
+            times = f"compile {result.compile_time:.2f}s run {result.run_time:.2f}s"
+            if result.status == "passed":
+                print(f"✅ {result.name} {times}")
+            else:
+                print((result.output + result.message).strip())
+                print(f"❌ {result.name} {result.status} {times}")
+    elapsed = time.perf_counter() - start
+
+    results.sort(key=lambda r: r.name)
+    passed = sum(r.status == "passed" for r in results)
+    print(f"{passed}/{len(results)} passed in {elapsed:.2f}s")
+
+    if args.junit:
+        write_junit(results, args.junit, elapsed)
+    if args.json:
+        write_json(results, args.json, elapsed)
+
+    if passed != len(results):
+        exit(1)
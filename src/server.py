@@ -0,0 +1,103 @@
+import contextlib
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import traceback
+
+from cache import CACHE_PATH
+
+SOCKET_PATH = os.path.join(CACHE_PATH, "server.sock")
+
+# modes that would take over the server
+RESIDENT_MODES = {"watch", "serve"}
+
+
+def respond(request):
+    # Runs one command line, {"args": [...], "cwd": path}, like the aiur
+    # script would from cwd. The answer carries its exit status and what it
+    # printed. The program of `c -r` is left to the client to run, in its
+    # own terminal.
+    import main
+
+    stdout, stderr = io.StringIO(), io.StringIO()
+    response = {"status": 0}
+    cwd = os.getcwd()
+    try:
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            try:
+                os.chdir(request["cwd"])
+                args = main.argument_parser().parse_args(request["args"])
+                if args.mode in RESIDENT_MODES:
+                    sys.exit(f"{args.mode} can't run inside aiur serve")
+                if getattr(args, "run", False):
+                    args.run = False
+                    response["run"] = os.path.abspath(args.out_path)
+                args.func(args)
+            except SystemExit as e:
+                if isinstance(e.code, str):
+                    print(e.code, file=sys.stderr)
+                    response["status"] = 1
+                else:
+                    response["status"] = e.code or 0
+            except Exception:
+                traceback.print_exc()
+                response["status"] = 1
+    finally:
+        os.chdir(cwd)
+
+    if response["status"] != 0:
+        response.pop("run", None)
+    response["stdout"] = stdout.getvalue()
+    response["stderr"] = stderr.getvalue()
+    return response
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            return
+        self.wfile.write(json.dumps(respond(request)).encode() + b"\n")
+
+
+def serving(path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        try:
+            s.connect(path)
+        except OSError:
+            return False
+    return True
+
+
+def serve(args):
+    # Requests are handled one at a time, they share the process's working
+    # directory and output
+    if serving(args.socket):
+        sys.exit(f"another server is listening on {args.socket}")
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(args.socket)
+    os.makedirs(os.path.dirname(os.path.abspath(args.socket)), exist_ok=True)
+
+    # only the user's own processes may connect
+    umask = os.umask(0o177)
+    try:
+        server = socketserver.UnixStreamServer(args.socket, Handler)
+    finally:
+        os.umask(umask)
+
+    # a kill cleans up like ^C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    print(f"serving on {args.socket}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(args.socket)
@@ -0,0 +1,179 @@
+import json
+import os
+import re
+import tempfile
+from dataclasses import asdict, dataclass
+from typing import Dict, List
+
+from cache import CACHE_PATH
+
+INDEX_PATH = os.path.join(CACHE_PATH, "stdlib_index.json")
+INDEX_VERSION = 3
+
+EXPORT_RE = re.compile(r"\/\/(\s+)?export ([a-zA-Z0-9:_]+)")
+INCLUDE_RE = re.compile(r"^#include\s*([<\"])([^>\"]+)[>\"]", re.MULTILINE)
+TEMPLATE_RE = re.compile(r"template\s*<([^>]*)>\s*")
+TEMPLATE_PARAM_RE = re.compile(r"\b(?:typename|class)\s*(?:\.\.\.)?\s*(\w+)")
+FUNCTION_RE = re.compile(r"(.+?)\s*\b\w+\s*\(")
+SPECIFIERS_RE = re.compile(r"(?:(?:inline|static|constexpr)\s+)*")
+
+
+@dataclass
+class Module:
+    name: str
+    mtime: int
+    size: int
+    # exported symbol -> "function", "type", "macro" or "external"
+    symbols: Dict[str, str]
+    # exported function -> its C++ return type, for the functions whose
+    # return type doesn't depend on template parameters
+    returns: Dict[str, str]
+    # stdlib modules this one includes
+    dependencies: List[str]
+    # system headers this one includes
+    headers: List[str]
+
+
+def symbol_kind(lines, i):
+    # classify an export by the first declaration line after its comment
+    for line in lines[i+1:]:
+        line = line.strip()
+        if EXPORT_RE.match(line):
+            continue
+        if not line:
+            return "external"
+        if line.startswith("#define"):
+            return "macro"
+        if re.match(r"(template\s*<[^>]*>\s*)?(class|struct)\b", line):
+            return "type"
+        if "(" in line:
+            return "function"
+        return "external"
+    return "external"
+
+
+def return_type(lines, i):
+    # the return type of the function declared after an export comment
+    for j, line in enumerate(lines[i+1:], i+1):
+        line = line.strip()
+        if EXPORT_RE.match(line):
+            continue
+        template = TEMPLATE_RE.match(line)
+        if template is not None and template.end() == len(line) and j + 1 < len(lines):
+            # the template parameters are on a line of their own
+            line += " " + lines[j+1].strip()
+            template = TEMPLATE_RE.match(line)
+
+        params = set()
+        if template is not None:
+            params.update(TEMPLATE_PARAM_RE.findall(template.group(1)))
+            line = line[template.end():]
+        line = line[SPECIFIERS_RE.match(line).end():]
+        match = FUNCTION_RE.match(line)
+        if match is None:
+            return None
+        typ = match.group(1)
+        if params & set(re.findall(r"\w+", typ)):
+            return None
+        return typ
+    return None
+
+
+def scan_module(path, st):
+    with open(path) as f:
+        src = f.read()
+
+    lines = src.split("\n")
+    symbols = {}
+    returns = {}
+    for i, line in enumerate(lines):
+        match = EXPORT_RE.search(line)
+        if match:
+            symbol = match.group(2)
+            symbols[symbol] = symbol_kind(lines, i)
+            if symbols[symbol] == "function":
+                typ = return_type(lines, i)
+                if typ is not None:
+                    returns[symbol] = typ
+
+    dependencies, headers = [], []
+    for match in INCLUDE_RE.finditer(src):
+        (dependencies if match.group(1) == "\"" else headers).append(match.group(2))
+
+    return Module(os.path.basename(path), st.st_mtime_ns, st.st_size, symbols, returns, dependencies, headers)
+
+
+def read_index():
+    try:
+        with open(INDEX_PATH) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if index.get("version") != INDEX_VERSION:
+        return {}
+    return index["modules"]
+
+
+def write_index(modules):
+    try:
+        os.makedirs(os.path.dirname(INDEX_PATH), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(
+            dir=os.path.dirname(INDEX_PATH), prefix=".aiur-")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"version": INDEX_VERSION, "modules": modules}, f)
+        os.replace(tmp, INDEX_PATH)
+    except OSError:
+        pass
+
+
+_loaded = {}
+
+
+def load(include_path):
+    # Module name -> Module for every header in include_path. Headers whose
+    # mtime and size match the persisted index are not re-read, and the
+    # result is kept for the rest of the process while they stay the same.
+    include_path = os.path.realpath(include_path)
+    stats = {name: os.stat(os.path.join(include_path, name))
+             for name in os.listdir(include_path)}
+    stamp = {name: (st.st_mtime_ns, st.st_size) for name, st in stats.items()}
+    if include_path in _loaded and _loaded[include_path][0] == stamp:
+        return _loaded[include_path][1]
+
+    stored = read_index()
+    changed = False
+    modules = {}
+
+    for name, st in stats.items():
+        path = os.path.join(include_path, name)
+        entry = stored.get(path)
+        if entry is not None and entry["mtime"] == st.st_mtime_ns and entry["size"] == st.st_size:
+            modules[name] = Module(**entry)
+        else:
+            modules[name] = scan_module(path, st)
+            stored[path] = asdict(modules[name])
+            changed = True
+
+    for path in list(stored):
+        if os.path.dirname(path) == include_path and os.path.basename(path) not in modules:
+            del stored[path]
+            changed = True
+
+    if changed:
+        write_index(stored)
+
+    _loaded[include_path] = (stamp, modules)
+    return modules
+
+
+def dependencies(modules, names):
+    # names plus everything they include from the stdlib, transitively
+    seen = set()
+    stack = list(names)
+    while stack:
+        name = stack.pop()
+        if name in seen or name not in modules:
+            continue
+        seen.add(name)
+        stack.extend(modules[name].dependencies)
+    return seen
@@ -0,0 +1,149 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import subprocess
+import sys
+import time
+
+from modules import SOURCE_EXT
+
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+# editors often save by writing a new file and renaming it over the old
+# one, so renames count as changes too
+EVENTS = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+# struct inotify_event without the name that follows it
+EVENT = struct.Struct("iIII")
+
+# one save can be several events, they are collected for this long
+SETTLE = 0.05
+POLL_INTERVAL = 0.25
+
+
+def source_dirs(root):
+    for path, dirs, _ in os.walk(root):
+        dirs[:] = [name for name in dirs if not name.startswith(".")]
+        yield path
+
+
+class Inotify:
+    # Watches every directory under root, modules live in subdirectories of
+    # the program's directory
+    def __init__(self, root):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs = {}
+        self.add(root)
+
+    def add(self, root):
+        for path in source_dirs(root):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), EVENTS)
+            if wd >= 0:
+                self.dirs[wd] = path
+
+    def wait(self):
+        # blocks until a source file changed
+        while True:
+            select.select([self.fd], [], [])
+            if self.read():
+                while select.select([self.fd], [], [], SETTLE)[0]:
+                    self.read()
+                return
+
+    def read(self):
+        data = os.read(self.fd, 64 * 1024)
+        changed = False
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = os.fsdecode(data[offset:offset+length].rstrip(b"\0"))
+            offset += length
+
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and wd in self.dirs:
+                    self.add(os.path.join(self.dirs[wd], name))
+            elif name.endswith(SOURCE_EXT):
+                changed = True
+        return changed
+
+
+class Poller:
+    def __init__(self, root):
+        self.root = root
+        self.state = self.scan()
+
+    def scan(self):
+        state = {}
+        for path in source_dirs(self.root):
+            for name in os.listdir(path):
+                if name.endswith(SOURCE_EXT):
+                    try:
+                        st = os.stat(os.path.join(path, name))
+                    except FileNotFoundError:
+                        continue
+                    state[os.path.join(path, name)] = (st.st_mtime_ns, st.st_size)
+        return state
+
+    def wait(self):
+        while True:
+            time.sleep(POLL_INTERVAL)
+            state = self.scan()
+            if state != self.state:
+                self.state = state
+                return
+
+
+def watcher(root, poll=False):
+    if not poll and sys.platform.startswith("linux"):
+        try:
+            return Inotify(root)
+        except (OSError, AttributeError):
+            # AttributeError: the C library has no inotify
+            pass
+    return Poller(root)
+
+
+def watch(args):
+    # The compiler stays in this process, so a rebuild doesn't start it
+    # again. Unchanged files aren't parsed again and unchanged modules come
+    # from the object cache.
+    import main
+
+    root = os.path.dirname(os.path.abspath(args.path))
+    files = watcher(root, args.poll)
+    run = args.run
+    args.run = False
+
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                main.compile_file(args)
+                ok = True
+            except SystemExit as e:
+                if isinstance(e.code, str):
+                    print(e.code, file=sys.stderr)
+                ok = not e.code
+            elapsed = time.perf_counter() - start
+
+            if ok:
+                print(f"built {args.out_path} in {elapsed:.2f}s", file=sys.stderr)
+                if run:
+                    subprocess.run([os.path.abspath(args.out_path)])
+            else:
+                print(f"build failed after {elapsed:.2f}s", file=sys.stderr)
+            print(f"watching {root} for changes", file=sys.stderr)
+            files.wait()
+    except KeyboardInterrupt:
+        pass
@@ -1,41 +1,43 @@
 #pragma once
 #include <algorithm>
 #include <iostream>
+#include <string>
 #include <vector>
 
 namespace string {
 // export string::len
-size_t len(std::string s) { return s.length(); }
+inline size_t len(const std::string &s) { return s.length(); }
 
 // export string::at
-char at(std::string s, int n) { return s[n]; }
+inline char at(const std::string &s, int n) { return s[n]; }
 
 // export string::repeat
-std::string repeat(std::string s, int n) {
+inline std::string repeat(const std::string &s, int n) {
   std::string out;
+  out.reserve(s.length() * std::max(n, 0));
   for (int i = 0; i < n; i++)
     out += s;
   return out;
 }
 
 // export string::contains
-bool contains(std::string s, std::string n) {
+inline bool contains(const std::string &s, const std::string &n) {
   return s.find(n) != std::string::npos;
 }
 
 // export string::substr
-std::string substr(std::string s, int start, int size) {
+inline std::string substr(const std::string &s, int start, int size) {
   return s.substr(start, size);
 }
 
 // export string::reverse
-std::string reverse(std::string s) {
+inline std::string reverse(std::string s) {
   std::reverse(s.begin(), s.end());
   return s;
 }
 
 // export string::split
-std::vector<std::string> split(std::string s, std::string delim) {
+inline std::vector<std::string> split(std::string s, const std::string &delim) {
   std::vector<std::string> out;
   size_t pos;
   while ((pos = s.find(delim)) != std::string::npos) {
@@ -47,7 +49,8 @@ std::vector<std::string> split(std::string s, std::string delim) {
 }
 
 // export string::join
-std::string join(std::vector<std::string> v, std::string delim) {
+inline std::string join(const std::vector<std::string> &v,
+                        const std::string &delim) {
   std::string out;
   for (int i = 0; i < v.size(); i++) {
     out += v[i];
@@ -58,7 +61,8 @@ std::string join(std::vector<std::string> v, std::string delim) {
 }
 
 // export string::replace
-std::string replace(std::string s, std::string from, std::string to) {
+inline std::string replace(std::string s, const std::string &from,
+                    const std::string &to) {
   size_t n = 0;
   while ((n = s.find(from, n)) != std::string::npos) {
     s.replace(n, from.length(), to);
@@ -66,4 +70,23 @@ std::string replace(std::string s, std::string from, std::string to) {
   }
   return s;
 }
-}
\ No newline at end of file
+
+// export string::Builder
+class Builder {
+public:
+  std::string buf;
+};
+
+// export string::builder
+inline Builder builder() { return Builder(); }
+
+// export string::reserve
+inline void reserve(Builder &b, int n) { b.buf.reserve(n); }
+
+// export string::append
+inline void append(Builder &b, const std::string &s) { b.buf += s; }
+inline void append(Builder &b, char c) { b.buf += c; }
+
+// export string::finish
+inline std::string finish(Builder &b) { return std::move(b.buf); }
+}
@@ -1,30 +1,140 @@
 #pragma once
-#include <iostream>
+#include <charconv>
+#include <cstdio>
+#include <mutex>
 #include <sstream>
+#include <string>
+#include <string_view>
+#include <type_traits>
 #include <vector>
 
+#include <unistd.h>
+
 #include "_string.h"
+#include "std.h"
 
 namespace fmt {
 // export fmt::to_string
-template <typename T> std::string to_string(T t) {
+template <typename T> std::string to_string(const T &t) {
   std::stringstream s;
   s << t;
   return s.str();
 }
-template <typename T> std::string to_string(std::vector<T> t) {
+template <typename T> std::string to_string(const std::vector<T> &t) {
   std::vector<std::string> elems;
-  for (auto elem : t)
+  for (const auto &elem : t)
     elems.push_back(fmt::to_string(elem));
   return "[" + string::join(elems, " ") + "]";
 }
 
+// Everything fmt writes goes through one buffer that is flushed when it
+// fills up, on fmt::flush and at exit. Writing to a terminal flushes after
+// every print so interactive output isn't held back. While a for par loop
+// runs, a write or print holds the lock for all of its output.
+class Output {
+public:
+  Output() : interactive(isatty(STDOUT_FILENO)) {}
+  ~Output() { flush(); }
+
+  void put(std::string_view s) {
+    if (len + s.size() > sizeof(buf)) {
+      flush();
+      if (s.size() > sizeof(buf)) {
+        std::fwrite(s.data(), 1, s.size(), stdout);
+        return;
+      }
+    }
+    s.copy(buf + len, s.size());
+    len += s.size();
+  }
+  void put(char c) {
+    if (len == sizeof(buf))
+      flush();
+    buf[len++] = c;
+  }
+
+  void flush() {
+    std::fwrite(buf, 1, len, stdout);
+    std::fflush(stdout);
+    len = 0;
+  }
+
+  std::unique_lock<std::mutex> guard() {
+    // single threaded output doesn't pay for the lock
+    if (par::running)
+      return std::unique_lock<std::mutex>(mutex);
+    return std::unique_lock<std::mutex>(mutex, std::defer_lock);
+  }
+
+  const bool interactive;
+
+private:
+  std::mutex mutex;
+  char buf[1 << 16];
+  size_t len = 0;
+};
+
+inline Output &output() {
+  static Output out;
+  return out;
+}
+
+template <typename T> void format(Output &out, const T &t) {
+  if constexpr (std::is_same_v<T, bool>) {
+    // the same as streaming a bool
+    out.put(t ? '1' : '0');
+  } else if constexpr (std::is_same_v<T, char>) {
+    out.put(t);
+  } else if constexpr (std::is_integral_v<T>) {
+    char digits[24];
+    auto end = std::to_chars(digits, digits + sizeof(digits), t).ptr;
+    out.put(std::string_view(digits, end - digits));
+  } else if constexpr (std::is_floating_point_v<T>) {
+    // general with 6 significant digits is what streams print by default
+    char digits[64];
+    auto end = std::to_chars(digits, digits + sizeof(digits), t,
+                             std::chars_format::general, 6)
+                   .ptr;
+    out.put(std::string_view(digits, end - digits));
+  } else if constexpr (std::is_convertible_v<const T &, std::string_view>) {
+    out.put(std::string_view(t));
+  } else {
+    out.put(fmt::to_string(t));
+  }
+}
+template <typename T> void format(Output &out, const std::vector<T> &t) {
+  out.put('[');
+  for (size_t i = 0; i < t.size(); i++) {
+    if (i > 0)
+      out.put(' ');
+    fmt::format(out, t[i]);
+  }
+  out.put(']');
+}
+
 // export fmt::write
-template <typename T> void write(T t) { std::cout << fmt::to_string(t); }
+template <typename... T> void write(const T &...t) {
+  Output &out = output();
+  auto lock = out.guard();
+  (fmt::format(out, t), ...);
+}
 
 // export fmt::print
-template <typename T> void print(T t) {
-  fmt::write(t);
-  fmt::write("\n");
+template <typename T, typename... Rest>
+void print(const T &t, const Rest &...rest) {
+  Output &out = output();
+  auto lock = out.guard();
+  fmt::format(out, t);
+  ((out.put(' '), fmt::format(out, rest)), ...);
+  out.put('\n');
+  if (out.interactive)
+    out.flush();
+}
+
+// export fmt::flush
+inline void flush() {
+  Output &out = output();
+  auto lock = out.guard();
+  out.flush();
+}
 }
-}
\ No newline at end of file
@@ -1,40 +1,85 @@
 #pragma once
+#include <algorithm>
+#include <cerrno>
+#include <cstring>
+#include <deque>
 #include <iostream>
+#include <memory>
+#include <string>
+#include <string_view>
+#include <unordered_map>
+#include <vector>
 
 #include <netdb.h>
 #include <netinet/in.h>
+#include <netinet/tcp.h>
 #include <stdlib.h>
 #include <string.h>
+#include <sys/epoll.h>
 #include <sys/socket.h>
 #include <unistd.h>
 
 #include "_string.h"
 
 namespace net {
-// export net::connect
-int connect(std::string host, int port) {
-  int s;
-  if ((s = socket(AF_INET, SOCK_STREAM, 0)) == 0)
-    return -1;
+struct Address {
+  sockaddr_storage addr;
+  socklen_t len;
+  int family;
+};
 
-  struct hostent *lh = gethostbyname(host.c_str());
-  if (!lh)
-    return -1;
+// "host:port" -> its addresses, every host is looked up once per process
+inline std::unordered_map<std::string, std::vector<Address>> &resolved() {
+  static std::unordered_map<std::string, std::vector<Address>> cache;
+  return cache;
+}
 
-  struct sockaddr_in sa;
-  memset(&sa, 0, sizeof(sa));
-  sa.sin_family = AF_INET;
-  sa.sin_port = htons(port);
-  memcpy(&sa.sin_addr.s_addr, lh->h_addr, lh->h_length);
+inline const std::vector<Address> &resolve(const std::string &host, int port) {
+  std::string key = host + ":" + std::to_string(port);
+  auto it = resolved().find(key);
+  if (it != resolved().end())
+    return it->second;
 
-  if (connect(s, (struct sockaddr *)&sa, sizeof(sa)) < 0)
-    return -1;
+  std::vector<Address> addresses;
+  addrinfo hints, *info;
+  memset(&hints, 0, sizeof(hints));
+  hints.ai_family = AF_UNSPEC;
+  hints.ai_socktype = SOCK_STREAM;
+  if (getaddrinfo(host.c_str(), std::to_string(port).c_str(), &hints, &info) == 0) {
+    for (addrinfo *ai = info; ai != nullptr; ai = ai->ai_next) {
+      Address a;
+      memcpy(&a.addr, ai->ai_addr, ai->ai_addrlen);
+      a.len = ai->ai_addrlen;
+      a.family = ai->ai_family;
+      addresses.push_back(a);
+    }
+    freeaddrinfo(info);
+  }
+  // failed lookups aren't cached, the next call tries again
+  static const std::vector<Address> none;
+  if (addresses.empty())
+    return none;
+  return resolved()[key] = std::move(addresses);
+}
 
-  return s;
+// export net::connect
+inline int connect(const std::string &host, int port) {
+  for (const Address &a : resolve(host, port)) {
+    int s = socket(a.family, SOCK_STREAM, 0);
+    if (s < 0)
+      continue;
+    if (::connect(s, (const sockaddr *)&a.addr, a.len) == 0) {
+      int opt = 1;
+      setsockopt(s, IPPROTO_TCP, TCP_NODELAY, &opt, sizeof(opt));
+      return s;
+    }
+    close(s);
+  }
+  return -1;
 }
 
 // export net::server
-int server(int port) {
+inline int server(int port) {
   int s, c, opt = 1;
   struct sockaddr_in sa;
 
@@ -63,43 +108,631 @@ int server(int port) {
 }
 
 // export net::send_str
-bool send_str(int s, std::string data) {
-  return send(s, data.c_str(), data.length(), 0) != -1;
+inline bool send_str(int s, const std::string &data) {
+  size_t sent = 0;
+  while (sent < data.length()) {
+    ssize_t n = send(s, data.data() + sent, data.length() - sent, MSG_NOSIGNAL);
+    if (n <= 0)
+      return false;
+    sent += n;
+  }
+  return true;
 }
 
 // export net::receive
-std::string receive(int s) {
-  char buffer[65000];
-  memset(buffer, 0, 65000);
-  recv(s, buffer, 65000, 0);
-  return buffer;
+inline std::string receive(int s) {
+  char buffer[65536];
+  ssize_t n = recv(s, buffer, sizeof(buffer), 0);
+  return std::string(buffer, std::max<ssize_t>(n, 0));
 }
 
-// export net::http_get
-std::string http_get(std::string url) {
-  if (string::contains(url, "://"))
-    url = string::split(url, "://")[1];
+// A client socket and the bytes read from it that haven't been consumed
+// yet. The buffer is reused for every response on the connection and only
+// grows for header lines that don't fit it.
+class Connection {
+public:
+  Connection(int fd) : fd(fd), buf(1 << 16) {}
+  Connection(Connection &&c)
+      : fd(c.fd), buf(std::move(c.buf)), start(c.start), end(c.end) {
+    c.fd = -1;
+  }
+  Connection &operator=(Connection &&c) {
+    std::swap(fd, c.fd);
+    std::swap(buf, c.buf);
+    std::swap(start, c.start);
+    std::swap(end, c.end);
+    return *this;
+  }
+  ~Connection() {
+    if (fd >= 0)
+      close(fd);
+  }
+
+  std::string_view data() const {
+    return std::string_view(buf.data() + start, end - start);
+  }
+  void consume(size_t n) { start += n; }
 
-  std::string path = "/";
+  // reads more bytes, false once the peer has closed the connection
+  bool fill() {
+    if (start == end) {
+      start = end = 0;
+    } else if (end == buf.size()) {
+      if (start > 0) {
+        memmove(buf.data(), buf.data() + start, end - start);
+        end -= start;
+        start = 0;
+      } else {
+        buf.resize(buf.size() * 2);
+      }
+    }
+    ssize_t n = recv(fd, buf.data() + end, buf.size() - end, 0);
+    if (n <= 0)
+      return false;
+    end += n;
+    return true;
+  }
+
+  // until at least n unconsumed bytes are buffered
+  bool need(size_t n) {
+    while (end - start < n)
+      if (!fill())
+        return false;
+    return true;
+  }
 
-  if (string::contains(url, "/")) {
-    path = url.substr(url.find("/"));
-    url = url.substr(0, url.find("/"));
+  // the next CRLF terminated line, without the CRLF
+  bool line(std::string_view &out) {
+    size_t scanned = 0;
+    while (true) {
+      size_t pos = data().find("\r\n", scanned);
+      if (pos != std::string_view::npos) {
+        out = data().substr(0, pos);
+        consume(pos + 2);
+        return true;
+      }
+      scanned = std::max<size_t>(end - start, 1) - 1;
+      if (!fill())
+        return false;
+    }
   }
-  std::string host = url;
 
-  int sock = net::connect(host, 80);
-  net::send_str(sock,
-                "GET " + path + " HTTP/1.0\r\nHost: " + host + "\r\n\r\n");
+  int fd;
+
+private:
+  std::vector<char> buf;
+  size_t start = 0, end = 0;
+};
 
-  std::string out, chunk;
+// idle keep-alive connections by "host:port"
+class Pool {
+public:
+  // at most this many idle connections are kept per host
+  static const size_t MAX_IDLE = 8;
+
+  bool take(const std::string &key, Connection &c) {
+    auto it = idle.find(key);
+    if (it == idle.end() || it->second.empty())
+      return false;
+    c = std::move(it->second.back());
+    it->second.pop_back();
+    return true;
+  }
+
+  void give(const std::string &key, Connection &&c) {
+    auto &conns = idle[key];
+    if (conns.size() < MAX_IDLE)
+      conns.push_back(std::move(c));
+  }
+
+private:
+  std::unordered_map<std::string, std::vector<Connection>> idle;
+};
+
+inline Pool &pool() {
+  static Pool p;
+  return p;
+}
+
+struct Url {
+  std::string host, path;
+  int port;
+};
+
+inline bool parse_url(std::string url, Url &out) {
+  if (string::contains(url, "://")) {
+    // there is no TLS support
+    if (url.compare(0, 7, "http://") != 0)
+      return false;
+    url.erase(0, 7);
+  }
+
+  size_t slash = url.find('/');
+  out.path = slash == std::string::npos ? "/" : url.substr(slash);
+  std::string host = url.substr(0, slash);
+
+  out.port = 80;
+  size_t colon = host.rfind(':');
+  if (colon != std::string::npos) {
+    out.port = atoi(host.c_str() + colon + 1);
+    host.erase(colon);
+  }
+  out.host = host;
+  return !host.empty() && out.port > 0;
+}
+
+inline bool equals_lower(std::string_view s, std::string_view lower) {
+  return s.size() == lower.size() &&
+         std::equal(s.begin(), s.end(), lower.begin(),
+                    [](char a, char b) { return tolower(a) == b; });
+}
+
+inline bool contains_lower(std::string_view s, std::string_view lower) {
+  std::string l(s);
+  std::transform(l.begin(), l.end(), l.begin(), ::tolower);
+  return l.find(lower) != std::string::npos;
+}
+
+// appends the next n bytes of the connection to out, they are copied out
+// of the connection's buffer as they arrive so it doesn't grow with them
+inline bool read_body(Connection &c, std::string &out, size_t n) {
+  out.reserve(out.size() + n);
+  while (n > 0) {
+    if (c.data().empty() && !c.fill())
+      return false;
+    size_t take = std::min(n, c.data().size());
+    out.append(c.data().data(), take);
+    c.consume(take);
+    n -= take;
+  }
+  return true;
+}
+
+// Reads one response off the connection into body. keep_alive tells
+// whether the connection can carry another request afterwards.
+inline bool read_response(Connection &c, std::string &body, bool &keep_alive) {
+  std::string_view line;
+  int status;
+  long length;
+  bool chunked;
+  // 1xx responses are followed by the real one
   do {
-    chunk = net::receive(sock);
-    out += chunk;
-  } while (string::len(chunk) > 0);
+    if (!c.line(line) || line.size() < 12 || line.compare(0, 5, "HTTP/") != 0)
+      return false;
+    keep_alive = line.compare(0, 8, "HTTP/1.0") != 0;
+    status = atoi(std::string(line.substr(9, 3)).c_str());
+    length = -1;
+    chunked = false;
+
+    while (true) {
+      if (!c.line(line))
+        return false;
+      if (line.empty())
+        break;
+      size_t colon = line.find(':');
+      if (colon == std::string_view::npos)
+        continue;
+      std::string_view name = line.substr(0, colon);
+      std::string_view value = line.substr(colon + 1);
+      if (equals_lower(name, "content-length"))
+        length = strtol(std::string(value).c_str(), nullptr, 10);
+      else if (equals_lower(name, "transfer-encoding"))
+        chunked = contains_lower(value, "chunked");
+      else if (equals_lower(name, "connection") && contains_lower(value, "close"))
+        keep_alive = false;
+      else if (equals_lower(name, "connection") && contains_lower(value, "keep-alive"))
+        keep_alive = true;
+    }
+  } while (status >= 100 && status < 200);
+
+  body.clear();
+  if (status == 204 || status == 304)
+    return true;
+
+  if (chunked) {
+    while (true) {
+      // the size may be followed by extensions, strtoul stops at them
+      if (!c.line(line))
+        return false;
+      size_t size = strtoul(std::string(line).c_str(), nullptr, 16);
+      if (size == 0)
+        break;
+      if (!read_body(c, body, size) || !c.need(2))
+        return false;
+      c.consume(2);
+    }
+    // trailers, up to the empty line
+    do {
+      if (!c.line(line))
+        return false;
+    } while (!line.empty());
+    return true;
+  }
+
+  if (length >= 0)
+    return read_body(c, body, length);
+
+  // without a length the body ends with the connection
+  keep_alive = false;
+  do {
+    body.append(c.data());
+    c.consume(c.data().size());
+  } while (c.fill());
+  return true;
+}
+
+inline std::string request(const Url &url) {
+  std::string host = url.host;
+  if (url.port != 80)
+    host += ":" + std::to_string(url.port);
+  return "GET " + url.path + " HTTP/1.1\r\nHost: " + host +
+         "\r\nUser-Agent: aiur\r\n\r\n";
+}
+
+// at most this many requests are in flight on a connection, so a large
+// batch can't leave both sides blocked on writes
+const size_t PIPELINE_DEPTH = 16;
+
+// Fetches the urls at the given indices, which share a host, pipelined over
+// one connection at a time. Requests the server didn't answer before
+// closing the connection are sent again on a new one.
+inline void fetch(const std::string &key, const std::vector<Url> &urls,
+           const std::vector<size_t> &indices, std::vector<std::string> &bodies) {
+  size_t next = 0;
+  while (next < indices.size()) {
+    Connection c(-1);
+    bool reused = pool().take(key, c);
+    if (!reused) {
+      const Url &url = urls[indices[next]];
+      c = Connection(net::connect(url.host, url.port));
+      if (c.fd < 0)
+        return;
+    }
+
+    size_t answered = 0;
+    bool ok = true, keep_alive = true;
+    while (ok && keep_alive && next < indices.size()) {
+      size_t batch = std::min(PIPELINE_DEPTH, indices.size() - next);
+      std::string requests;
+      for (size_t i = 0; i < batch; i++)
+        requests += request(urls[indices[next + i]]);
+      ok = net::send_str(c.fd, requests);
+
+      for (size_t i = 0; ok && keep_alive && i < batch; i++) {
+        ok = read_response(c, bodies[indices[next]], keep_alive);
+        if (ok) {
+          next++;
+          answered++;
+        }
+      }
+    }
+
+    if (ok && keep_alive) {
+      pool().give(key, std::move(c));
+    } else if (!ok && answered == 0 && !reused) {
+      // a pooled connection may have been closed while it was idle, but a
+      // new one that fails right away would fail again
+      bodies[indices[next]].clear();
+      return;
+    }
+  }
+}
+
+// export net::http_get_many
+inline std::vector<std::string> http_get_many(
+    const std::vector<std::string> &urls) {
+  // the body of every url, empty for the ones that couldn't be fetched
+  std::vector<std::string> bodies(urls.size());
+  std::vector<Url> parsed(urls.size());
+
+  std::vector<std::string> keys;
+  std::unordered_map<std::string, std::vector<size_t>> by_host;
+  for (size_t i = 0; i < urls.size(); i++) {
+    if (!parse_url(urls[i], parsed[i]))
+      continue;
+    std::string key = parsed[i].host + ":" + std::to_string(parsed[i].port);
+    auto &indices = by_host[key];
+    if (indices.empty())
+      keys.push_back(key);
+    indices.push_back(i);
+  }
+
+  for (const std::string &key : keys)
+    fetch(key, parsed, by_host[key], bodies);
+  return bodies;
+}
+
+// export net::http_get
+inline std::string http_get(const std::string &url) {
+  return http_get_many({url})[0];
+}
+
+// A listening socket and the connections accepted on it, driven by
+// net::next. Copies share the same listener, so it can be passed to
+// functions by value.
+class Listener {
+public:
+  struct Peer {
+    // input not read yet and output not sent yet, both keep their capacity
+    // between messages
+    std::string in, out;
+    size_t in_start = 0, out_start = 0;
+    // epoll events the connection is registered for, 0 when it isn't
+    uint32_t events = 0;
+    // the peer won't send anything more
+    bool eof = false;
+    // net::disconnect was called, it closes once the output is sent
+    bool closing = false;
+    // waiting to be returned by net::next
+    bool queued = false;
+  };
+
+  struct State {
+    int fd = -1, epfd = -1, port = 0;
+    std::unordered_map<int, Peer> peers;
+    std::deque<int> ready;
+    // every read goes through here before it is appended to a peer's input
+    std::vector<char> scratch = std::vector<char>(1 << 16);
 
-  out.erase(0, out.find("\r\n\r\n") + 4);
+    ~State() {
+      for (auto &peer : peers)
+        close(peer.first);
+      if (fd >= 0)
+        close(fd);
+      if (epfd >= 0)
+        close(epfd);
+    }
+  };
+
+  std::shared_ptr<State> state = std::make_shared<State>();
+};
+
+// registers the connection for the events it is waiting on
+inline void watch(Listener::State &s, int c, Listener::Peer &p) {
+  uint32_t events = 0;
+  if (!p.eof && !p.closing)
+    events |= EPOLLIN;
+  if (p.out_start < p.out.size())
+    events |= EPOLLOUT;
+  if (events == p.events)
+    return;
+
+  // a hung up socket keeps reporting EPOLLHUP, so one with nothing to wait
+  // for is removed instead of registered for no events
+  epoll_event ev = {};
+  ev.events = events;
+  ev.data.fd = c;
+  if (events == 0)
+    epoll_ctl(s.epfd, EPOLL_CTL_DEL, c, nullptr);
+  else
+    epoll_ctl(s.epfd, p.events == 0 ? EPOLL_CTL_ADD : EPOLL_CTL_MOD, c, &ev);
+  p.events = events;
+}
 
+inline void queue(Listener::State &s, int c, Listener::Peer &p) {
+  if (!p.queued && !p.closing) {
+    p.queued = true;
+    s.ready.push_back(c);
+  }
+}
+
+inline void drop(Listener::State &s, int c) {
+  close(c);
+  s.peers.erase(c);
+}
+
+// Sends as much pending output as the socket takes without blocking, false
+// if the connection failed or was closed
+inline bool flush(Listener::State &s, int c) {
+  auto it = s.peers.find(c);
+  if (it == s.peers.end())
+    return false;
+  Listener::Peer &p = it->second;
+
+  while (p.out_start < p.out.size()) {
+    ssize_t n = send(c, p.out.data() + p.out_start, p.out.size() - p.out_start,
+                     MSG_NOSIGNAL | MSG_DONTWAIT);
+    if (n < 0 && (errno == EAGAIN || errno == EWOULDBLOCK))
+      break;
+    if (n < 0) {
+      if (p.closing) {
+        drop(s, c);
+        return false;
+      }
+      // the peer is gone, net::next reports it as closed
+      p.out.clear();
+      p.out_start = 0;
+      p.eof = true;
+      queue(s, c, p);
+      watch(s, c, p);
+      return false;
+    }
+    p.out_start += n;
+  }
+
+  if (p.out_start == p.out.size()) {
+    p.out.clear();
+    p.out_start = 0;
+    if (p.closing) {
+      drop(s, c);
+      return true;
+    }
+  }
+  watch(s, c, p);
+  return true;
+}
+
+inline void receive(Listener::State &s, int c, Listener::Peer &p) {
+  bool changed = false;
+  while (!p.eof) {
+    ssize_t n = recv(c, s.scratch.data(), s.scratch.size(), MSG_DONTWAIT);
+    if (n < 0 && (errno == EAGAIN || errno == EWOULDBLOCK))
+      break;
+    if (n <= 0) {
+      p.eof = true;
+    } else if (!p.closing) {
+      p.in.append(s.scratch.data(), n);
+    }
+    changed = true;
+  }
+  if (changed)
+    queue(s, c, p);
+  watch(s, c, p);
+}
+
+inline void accept_all(Listener::State &s) {
+  while (true) {
+    int c = accept4(s.fd, nullptr, nullptr, SOCK_NONBLOCK | SOCK_CLOEXEC);
+    if (c < 0)
+      return;
+    int opt = 1;
+    setsockopt(c, IPPROTO_TCP, TCP_NODELAY, &opt, sizeof(opt));
+    watch(s, c, s.peers[c]);
+  }
+}
+
+// export net::listen
+inline Listener listen(int port) {
+  // port 0 picks a free port, net::port tells which
+  Listener l;
+  Listener::State &s = *l.state;
+  int opt = 1;
+
+  s.fd = socket(AF_INET, SOCK_STREAM | SOCK_NONBLOCK | SOCK_CLOEXEC, 0);
+  if (s.fd < 0)
+    return l;
+  setsockopt(s.fd, SOL_SOCKET, SO_REUSEADDR, &opt, sizeof(opt));
+
+  sockaddr_in sa = {};
+  sa.sin_family = AF_INET;
+  sa.sin_addr.s_addr = INADDR_ANY;
+  sa.sin_port = htons(port);
+  socklen_t len = sizeof(sa);
+  s.epfd = epoll_create1(EPOLL_CLOEXEC);
+  if (s.epfd < 0 || ::bind(s.fd, (sockaddr *)&sa, sizeof(sa)) < 0 ||
+      ::listen(s.fd, SOMAXCONN) < 0 ||
+      getsockname(s.fd, (sockaddr *)&sa, &len) < 0) {
+    close(s.fd);
+    s.fd = -1;
+    return l;
+  }
+  s.port = ntohs(sa.sin_port);
+
+  epoll_event ev = {};
+  ev.events = EPOLLIN;
+  ev.data.fd = s.fd;
+  epoll_ctl(s.epfd, EPOLL_CTL_ADD, s.fd, &ev);
+  return l;
+}
+
+// export net::port
+inline int port(const Listener &l) { return l.state->port; }
+
+// export net::next
+inline int next(Listener &l) {
+  // Accepts connections and moves data until a connection received input
+  // or hung up, and returns it. A connection is returned again only once
+  // more input arrives. -1 if the listener couldn't be set up.
+  Listener::State &s = *l.state;
+  if (s.fd < 0)
+    return -1;
+
+  epoll_event events[256];
+  while (true) {
+    while (!s.ready.empty()) {
+      int c = s.ready.front();
+      s.ready.pop_front();
+      auto it = s.peers.find(c);
+      if (it != s.peers.end() && it->second.queued) {
+        it->second.queued = false;
+        return c;
+      }
+    }
+
+    int n = epoll_wait(s.epfd, events, 256, -1);
+    if (n < 0 && errno != EINTR)
+      return -1;
+    for (int i = 0; i < n; i++) {
+      int c = events[i].data.fd;
+      if (c == s.fd) {
+        accept_all(s);
+        continue;
+      }
+      if (events[i].events & EPOLLOUT && !net::flush(s, c))
+        continue;
+      auto it = s.peers.find(c);
+      if (it != s.peers.end() && events[i].events & (EPOLLIN | EPOLLHUP | EPOLLERR))
+        net::receive(s, c, it->second);
+    }
+  }
+}
+
+// export net::read
+inline std::string read(Listener &l, int c) {
+  // all input received on the connection so far
+  auto it = l.state->peers.find(c);
+  if (it == l.state->peers.end())
+    return "";
+  Listener::Peer &p = it->second;
+  std::string out = p.in.substr(p.in_start);
+  p.in.clear();
+  p.in_start = 0;
+  return out;
+}
+
+// export net::read_until
+inline std::string read_until(Listener &l, int c, const std::string &delim) {
+  // input up to and including delim, or "" if it hasn't arrived yet
+  auto it = l.state->peers.find(c);
+  if (it == l.state->peers.end())
+    return "";
+  Listener::Peer &p = it->second;
+  size_t pos = p.in.find(delim, p.in_start);
+  if (pos == std::string::npos)
+    return "";
+
+  size_t end = pos + delim.length();
+  std::string out = p.in.substr(p.in_start, end - p.in_start);
+  p.in_start = end;
+  if (p.in_start == p.in.size()) {
+    p.in.clear();
+    p.in_start = 0;
+  } else if (p.in_start > p.in.size() / 2) {
+    p.in.erase(0, p.in_start);
+    p.in_start = 0;
+  }
   return out;
 }
-}
\ No newline at end of file
+
+// export net::write
+inline bool write(Listener &l, int c, const std::string &data) {
+  // queues data and sends what the socket takes right away, the rest is
+  // sent by net::next
+  auto it = l.state->peers.find(c);
+  if (it == l.state->peers.end() || it->second.closing)
+    return false;
+  it->second.out += data;
+  return net::flush(*l.state, c);
+}
+
+// export net::closed
+inline bool closed(Listener &l, int c) {
+  // the peer hung up and all of its input was read
+  auto it = l.state->peers.find(c);
+  return it == l.state->peers.end() ||
+         (it->second.eof && it->second.in_start == it->second.in.size());
+}
+
+// export net::disconnect
+inline void disconnect(Listener &l, int c) {
+  // closes the connection once its pending output is sent, connections the
+  // peer hung up on stay open until this is called
+  auto it = l.state->peers.find(c);
+  if (it == l.state->peers.end())
+    return;
+  it->second.closing = true;
+  it->second.in.clear();
+  it->second.in_start = 0;
+  net::flush(*l.state, c);
+}
+}
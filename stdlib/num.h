@@ -1,27 +1,55 @@
 #pragma once
 #include <cmath>
 #include <iostream>
+#include <stdexcept>
 #include <vector>
 
 namespace num {
 // export num::sqrt
-float sqrt(float n) { return std::sqrt(n); }
+inline float sqrt(float n) { return std::sqrt(n); }
 
 // export num::from_string
-float from_string(std::string s) { return std::stof(s); }
+inline float from_string(std::string s) { return std::stof(s); }
 
 // export num::rand
-float random() {
+inline float random() {
   srand(time(0));
   return rand();
 }
 
+// export num::Range
+class Range {
+public:
+  class iterator {
+  public:
+    iterator(int value, int step) : value(value), step(step) {}
+    int operator*() const { return value; }
+    iterator &operator++() {
+      value += step;
+      return *this;
+    }
+    bool operator!=(const iterator &end) const {
+      return step > 0 ? value < end.value : value > end.value;
+    }
+
+  private:
+    int value, step;
+  };
+
+  Range(int start, int end, int step) : start(start), stop(end), step(step) {
+    if (step == 0)
+      throw std::invalid_argument("num::range step must not be zero");
+  }
+  iterator begin() const { return iterator(start, step); }
+  iterator end() const { return iterator(stop, step); }
+
+private:
+  int start, stop, step;
+};
+
 // export num::range
-std::vector<int> range(int start, int end) {
-  std::vector<int> out;
-  for (int i = start; i < end; i++)
-    out.push_back(i);
-  return out;
+inline Range range(int start, int end, int step = 1) {
+  return Range(start, end, step);
 }
-std::vector<int> range(int end) { return range(0, end); }
+inline Range range(int end) { return Range(0, end, 1); }
 }
@@ -0,0 +1,248 @@
+#pragma once
+#include <algorithm>
+#include <atomic>
+#include <condition_variable>
+#include <cstdlib>
+#include <exception>
+#include <memory>
+#include <mutex>
+#include <thread>
+#include <vector>
+
+#include "std.h"
+
+namespace par {
+// every worker starts out with this many chunks of a loop, idle workers
+// steal from the others
+const long CHUNKS_PER_WORKER = 8;
+
+// Runs the chunks of one loop at a time on a fixed set of threads. The
+// caller works on the loop too. Every worker owns a span of chunks and
+// takes from its front, a worker whose span ran out steals the back half
+// of another one.
+class Pool {
+public:
+  Pool(size_t workers) : spans(workers) {
+    for (size_t id = 1; id < workers; id++)
+      threads.emplace_back([this, id] { serve(id); });
+  }
+
+  ~Pool() {
+    {
+      std::lock_guard<std::mutex> lock(mutex);
+      stopping = true;
+    }
+    wake.notify_all();
+    for (auto &thread : threads)
+      thread.join();
+  }
+
+  size_t size() const { return spans.size(); }
+
+  // calls fn(lo, hi) for the iterations [lo, hi) of each chunk
+  template <typename F> void run(long count, long chunk, const F &fn) {
+    long chunks = (count + chunk - 1) / chunk;
+    for (size_t id = 0; id < spans.size(); id++) {
+      spans[id].lo = chunks * id / spans.size();
+      spans[id].hi = chunks * (id + 1) / spans.size();
+    }
+    this->count = count;
+    this->chunk = chunk;
+    this->fn = &fn;
+    this->call = [](const void *fn, long lo, long hi) {
+      (*static_cast<const F *>(fn))(lo, hi);
+    };
+    error = nullptr;
+
+    {
+      std::lock_guard<std::mutex> lock(mutex);
+      active = threads.size();
+      job++;
+      running = true;
+    }
+    wake.notify_all();
+
+    // the caller works on the loop as well, a loop nested in one of its
+    // chunks has to run serially like on the workers
+    worker = true;
+    work(0);
+    worker = false;
+    // the workers are waited for even when there is nothing left to take,
+    // so none of them can still be looking at this loop once it returns
+    std::unique_lock<std::mutex> lock(mutex);
+    done.wait(lock, [this] { return active == 0; });
+    running = false;
+    if (error)
+      std::rethrow_exception(error);
+  }
+
+private:
+  struct Span {
+    std::mutex mutex;
+    long lo = 0, hi = 0;
+  };
+
+  void serve(size_t id) {
+    worker = true;
+    size_t seen = 0;
+    while (true) {
+      {
+        std::unique_lock<std::mutex> lock(mutex);
+        wake.wait(lock, [&] { return stopping || job != seen; });
+        if (stopping)
+          return;
+        seen = job;
+      }
+      work(id);
+      std::lock_guard<std::mutex> lock(mutex);
+      if (--active == 0)
+        done.notify_one();
+    }
+  }
+
+  void work(size_t id) {
+    long c;
+    while (take(id, c) || steal(id, c)) {
+      long lo = c * chunk, hi = std::min(count, lo + chunk);
+      try {
+        call(fn, lo, hi);
+      } catch (...) {
+        std::lock_guard<std::mutex> lock(mutex);
+        if (!error)
+          error = std::current_exception();
+      }
+    }
+  }
+
+  bool take(size_t id, long &c) {
+    Span &own = spans[id];
+    std::lock_guard<std::mutex> lock(own.mutex);
+    if (own.lo == own.hi)
+      return false;
+    c = own.lo++;
+    return true;
+  }
+
+  bool steal(size_t id, long &c) {
+    for (size_t i = 1; i < spans.size(); i++) {
+      Span &victim = spans[(id + i) % spans.size()];
+      long lo, hi;
+      {
+        std::lock_guard<std::mutex> lock(victim.mutex);
+        if (victim.lo == victim.hi)
+          continue;
+        hi = victim.hi;
+        lo = victim.hi = victim.hi - (victim.hi - victim.lo + 1) / 2;
+      }
+      Span &own = spans[id];
+      std::lock_guard<std::mutex> lock(own.mutex);
+      own.lo = lo + 1;
+      own.hi = hi;
+      c = lo;
+      return true;
+    }
+    return false;
+  }
+
+  std::vector<Span> spans;
+  std::vector<std::thread> threads;
+
+  std::mutex mutex;
+  std::condition_variable wake, done;
+  size_t job = 0, active = 0;
+  bool stopping = false;
+
+  long count = 0, chunk = 1;
+  const void *fn = nullptr;
+  void (*call)(const void *, long, long) = nullptr;
+  std::exception_ptr error;
+
+public:
+  // loops started inside a chunk, on a worker or on the thread running
+  // the loop, run serially, they would otherwise wait on the pool they are
+  // part of
+  static inline thread_local bool worker = false;
+};
+
+inline size_t default_workers() {
+  // AIUR_THREADS, or one worker per hardware thread
+  if (const char *env = getenv("AIUR_THREADS"))
+    if (atoi(env) > 0)
+      return atoi(env);
+  return std::max(std::thread::hardware_concurrency(), 1u);
+}
+
+inline std::unique_ptr<Pool> &pool() {
+  static std::unique_ptr<Pool> p;
+  return p;
+}
+
+// export par::set_workers
+inline void set_workers(int n) {
+  pool() = std::make_unique<Pool>(std::max(n, 1));
+}
+
+// export par::workers
+inline int workers() {
+  if (!pool())
+    pool() = std::make_unique<Pool>(default_workers());
+  return pool()->size();
+}
+
+// export par::for_range
+template <typename F>
+void for_range(long start, long end, long step, const F &fn) {
+  // The loop `for (i = start; i < end; i += step)`, or `>` for a negative
+  // step, split in chunks. fn(first, last) runs the iterations of one chunk
+  // from first up to, not including, last.
+  long count = step > 0 ? (end - start + step - 1) / step
+                        : (start - end - step - 1) / -step;
+  if (count <= 0)
+    return;
+
+  long chunks = workers() * CHUNKS_PER_WORKER;
+  long chunk = std::max((count + chunks - 1) / chunks, 1L);
+  if (Pool::worker || pool()->size() == 1 || count == 1) {
+    fn(start, start + count * step);
+    return;
+  }
+  pool()->run(count, chunk, [&](long lo, long hi) {
+    fn(start + lo * step, start + hi * step);
+  });
+}
+
+// Reductions. Every chunk accumulates into its own copy of the variable,
+// which starts at identity(init), and merges it into the shared one. init is
+// the value of the variable before the loop, never the shared variable that
+// other chunks are merging into.
+inline std::mutex reduce_mutex;
+
+struct Sum {
+  template <typename T> static T identity(const T &) { return T(); }
+  template <typename T> static void merge(T &shared, const T &local) {
+    shared += local;
+  }
+};
+
+struct Min {
+  template <typename T> static T identity(const T &init) { return init; }
+  template <typename T> static void merge(T &shared, const T &local) {
+    if (local < shared)
+      shared = local;
+  }
+};
+
+struct Max {
+  template <typename T> static T identity(const T &init) { return init; }
+  template <typename T> static void merge(T &shared, const T &local) {
+    if (shared < local)
+      shared = local;
+  }
+};
+
+// export par::reduce
+template <typename Op, typename T> void reduce(T &shared, const T &local) {
+  std::lock_guard<std::mutex> lock(reduce_mutex);
+  Op::merge(shared, local);
+}
+}
@@ -1,4 +1,10 @@
+#pragma once
+#include <cstdint>
+#include <cstdlib>
 #include <functional>
+#include <string>
+
+#include <unistd.h>
 
 // export close
 // export exit
@@ -16,3 +22,9 @@ public:
 private:
   std::function<void()> m_callback;
 };
+
+namespace par {
+// true while a for par loop runs on several threads, fmt locks its output
+// buffer then
+inline bool running = false;
+}